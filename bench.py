@@ -0,0 +1,397 @@
+# Benchmark for the ospi endpoints.
+#
+# Seeds a local database (SQLite by default, or a throwaway Postgres given
+# with --database-url), replaces TARGETTED_REG_URL and BUBBLE_DATA_URL with
+# local fake servers with configurable latency, serves the app on a local
+# port and reports latency percentiles, throughput and SQL statements per
+# request for each route as JSON.
+#
+#   python bench.py --scale 0.01 --output bench_output.json
+#
+# --scale 1 seeds the full target volumes: 10k products, 100k modules and
+# scenarios and 1M test cases.
+#
+# Cold start (import plus create_app() in a fresh interpreter) is measured
+# too. With --startup-budget-ms the script exits with status 1 when the
+# median is over budget; --startup-only skips the load benchmark.
+# tests/test_startup.py enforces the budget under pytest.
+#
+#   python bench.py --startup-only --startup-budget-ms 1500
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import subprocess
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Full-size volumes, multiplied by --scale
+VOLUMES = {
+    'users': 1000,
+    'products': 10000,
+    'versions': 20000,
+    'modules': 100000,
+    'scenarios': 100000,
+    'testcases': 1000000,
+    'htmlcodes': 10000
+}
+
+SEED_BATCH_SIZE = 10000
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    # Stands in for the scorer and for Bubble. The scorer echoes each case
+    # back with a failure_probability, as the real one does.
+    latency = 0.0
+    scorer = False
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        if self.scorer:
+            cases = json.loads(body)
+            if isinstance(cases, list):
+                payload = [dict(case, failure_probability=random.random()) for case in cases]
+            else:
+                payload = [dict(cases, failure_probability=random.random())]
+            response = json.dumps(payload).encode()
+        else:
+            response = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    # The app opens up to SCORER_MAX_WORKERS connections per request, more
+    # than the default listen backlog of 5 allows
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def start_fake_server(latency_ms, scorer):
+    handler = type('Handler', (FakeUpstreamHandler,), {'latency': latency_ms / 1000.0, 'scorer': scorer})
+    server = FakeUpstreamServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def seed(ospi, counts, rng):
+    # Every scenario i belongs to module i, so a module id is also a valid
+    # scenario id for the generated requests
+    tables = [
+        (ospi.Users, lambda i: {'id': i, 'name': f'user {i}', 'email': f'user{i}@example.com', 'testcasesleft': 100}),
+        (ospi.Products, lambda i: {
+            'id': i,
+            'product_name': f'product {i}',
+            'answer1': 'a' * 500,
+            'answer2': 'b' * 500,
+            'answer3': 'c' * 500,
+            'answer4': 'd' * 500,
+            'type': 'web',
+            'chatsummary': 'summary ' * 200,
+            'user_id': i % counts['users'] + 1
+        }),
+        (ospi.Versions, lambda i: {'id': i, 'product_id': i % counts['products'] + 1, 'version_name': f'v{i}'}),
+        (ospi.Modules, lambda i: {
+            'id': i,
+            'modulenumber': i,
+            'modulename': f'module {i}',
+            'productversion_id': i % counts['versions'] + 1
+        }),
+        (ospi.Scenarios, lambda i: {'id': i, 'scenarionumber': i, 'scenarioname': f'scenario {i}', 'module_id': i}),
+        (ospi.TestCases, lambda i: {
+            'id': i,
+            'testcasenumber': i,
+            'testcasename': f'test case {i}',
+            'testcasedetails': 'details',
+            'priority': rng.choice(['High', 'Medium', 'Low']),
+            'severity': rng.choice(['Critical', 'Major', 'Minor']),
+            'status': rng.choice([True, False, None]),
+            'steps': 'step\n' * 10,
+            'expectedresults': 'result\n' * 5,
+            'scenario_id': i % counts['scenarios'] + 1,
+            'module_id': i % counts['scenarios'] + 1,
+            'failure_probability': rng.random()
+        }),
+        (ospi.HtmlCodes, lambda i: {'id': i, 'htmlcode': '<html>' + 'x' * 5000 + '</html>', 'module_id': i % counts['modules'] + 1})
+    ]
+    with ospi.db.engine.begin() as connection:
+        for model, make_row in tables:
+            total = counts[model.__tablename__]
+            for start in range(1, total + 1, SEED_BATCH_SIZE):
+                rows = [make_row(i) for i in range(start, min(start + SEED_BATCH_SIZE, total + 1))]
+                connection.execute(model.__table__.insert(), rows)
+
+
+def build_requests(name, counts, args, rng):
+    # Returns the (method, path, json_body) list for one route, built up front
+    # so request generation is not part of the measured time
+    run_id = int(time.time() * 1000)
+    user_id = lambda: rng.randint(1, counts['users'])
+    version_id = lambda: rng.randint(1, counts['versions'])
+    test_case_id = lambda: rng.randint(1, counts['testcases'])
+
+    def bulk_payload(i):
+        module_id = rng.randint(1, counts['modules'])
+        return [
+            {
+                'testcasename': f'bench {run_id} {i} {n}',
+                'priority': 'High',
+                'severity': 'Major',
+                'scenario_id': module_id,
+                'module_id': module_id,
+                'status': None,
+                'testcasedetails': 'generated by bench.py'
+            }
+            for n in range(args.bulk_rows)
+        ]
+
+    builders = {
+        'testcasesbulk': lambda i: ('POST', '/ospi/testcasesbulk', bulk_payload(i)),
+        'testcases_update': lambda i: ('POST', '/ospi/testcases/update', {'testCases': [
+            {'id': test_case_id(), 'priority': rng.choice(['High', 'Low']), 'status': 'Pass'}
+            for _ in range(args.update_rows)
+        ]}),
+        'testcase_update_individual': lambda i: ('PATCH', '/ospi/testcases/updateinduvidual', {
+            'id': test_case_id(), 'severity': rng.choice(['Major', 'Minor'])
+        }),
+        'products': lambda i: ('GET', f'/ospi/users/{user_id()}/products', None),
+        'products_withversion': lambda i: ('GET', f'/ospi/users/{user_id()}/products_withversion', None),
+        'chat_summary': lambda i: ('GET', f'/ospi/products/versions/{version_id()}', None),
+        'html': lambda i: ('GET', f'/ospi/html/{version_id()}', None),
+        'add_version': lambda i: ('POST', '/ospi/addVersion', {
+            'productId': rng.randint(1, counts['products']), 'version_name': f'bench {run_id} {i}', 'changes': ''
+        }),
+        'add_html': lambda i: ('POST', '/ospi/addHTML', {
+            'html_content': '<html>' + 'y' * 5000 + '</html>', 'module_id': rng.randint(1, counts['modules'])
+        })
+    }
+    total = args.bulk_requests if name == 'testcasesbulk' else args.requests
+    return [builders[name](i) for i in range(total)]
+
+
+ROUTES = [
+    'testcasesbulk',
+    'testcases_update',
+    'testcase_update_individual',
+    'products',
+    'products_withversion',
+    'chat_summary',
+    'html',
+    'add_version',
+    'add_html'
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_route(base_url, route_requests, concurrency, statement_counter):
+    import requests
+
+    local = threading.local()
+
+    def send(route_request):
+        method, path, body = route_request
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.request(method, base_url + path, json=body)
+        elapsed = time.perf_counter() - started
+        return elapsed, response.status_code, response.text[:500] if response.status_code >= 400 else None
+
+    statements_before = statement_counter['count']
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, route_requests))
+    wall_time = time.perf_counter() - started
+    statements = statement_counter['count'] - statements_before
+
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in results)
+    errors = [error for _, status, error in results if status >= 400]
+    return {
+        'requests': len(results),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'throughput_rps': round(len(results) / wall_time, 2) if wall_time else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'max': round(latencies[-1], 3)
+        },
+        'sql_statements_per_request': round(statements / len(results), 2)
+    }
+
+
+# Run in a fresh interpreter without a database configured, as tooling would
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import test
+imported = time.perf_counter()
+test.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'total_ms': (created - started) * 1000,
+    'eager_modules': [name for name in ('requests', 'orjson') if name in sys.modules]
+}))
+'''
+
+
+def measure_startup(runs):
+    env = {key: value for key, value in os.environ.items() if key != 'SQLALCHEMY_DATABASE_URI'}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'runs': runs,
+        'import_ms': round(statistics.median(sample['import_ms'] for sample in samples), 1),
+        'create_app_ms': round(statistics.median(sample['create_app_ms'] for sample in samples), 1),
+        'total_ms': round(statistics.median(sample['total_ms'] for sample in samples), 1),
+        'eager_modules': samples[-1]['eager_modules']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ospi endpoints against a seeded local database.')
+    parser.add_argument('--database-url', help='Database to seed and serve from (default: a new SQLite file)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the seeded volumes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--routes', default=','.join(ROUTES), help='Comma-separated routes to run')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+    parser.add_argument('--bulk-requests', type=int, default=20, help='Requests for testcasesbulk')
+    parser.add_argument('--bulk-rows', type=int, default=50, help='Test cases per bulk request')
+    parser.add_argument('--update-rows', type=int, default=100, help='Test cases per bulk update request')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scorer-latency-ms', type=float, default=50)
+    parser.add_argument('--bubble-latency-ms', type=float, default=100)
+    parser.add_argument('--output', help='Write the JSON report here as well as to stdout')
+    parser.add_argument('--startup-runs', type=int, default=5, help='Fresh interpreters used to time cold start')
+    parser.add_argument('--startup-budget-ms', type=float, help='Exit with status 1 if median cold start is slower')
+    parser.add_argument('--startup-only', action='store_true', help='Only measure cold start')
+    args = parser.parse_args()
+
+    startup = measure_startup(args.startup_runs)
+    over_budget = args.startup_budget_ms is not None and startup['total_ms'] > args.startup_budget_ms
+    if args.startup_only:
+        print(json.dumps({'startup': startup, 'startup_budget_ms': args.startup_budget_ms}, indent=2, sort_keys=True))
+        sys.exit(1 if over_budget else 0)
+
+    scorer, scorer_url = start_fake_server(args.scorer_latency_ms, scorer=True)
+    bubble, bubble_url = start_fake_server(args.bubble_latency_ms, scorer=False)
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='ospi-bench-'), 'bench.db')
+
+    # create_app() reads its configuration from the environment
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_url
+    os.environ['TARGETTED_REG_URL'] = scorer_url
+    os.environ['BUBBLE_DATA_URL'] = bubble_url
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import test as ospi
+    app = ospi.create_app()
+    from sqlalchemy import DefaultClause, event
+    from werkzeug.serving import make_server
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    counts = {
+        table: max(1, int(volume * args.scale))
+        for table, volume in VOLUMES.items()
+    }
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        # The bulk import leaves testcasenumber to the database, which fills
+        # it in production; give the generated schema a default as well
+        ospi.TestCases.__table__.c.testcasenumber.server_default = DefaultClause('0')
+        ospi.db.create_all()
+
+        seed_started = time.perf_counter()
+        seed(ospi, counts, rng)
+        seed_seconds = time.perf_counter() - seed_started
+
+        statement_counter = {'count': 0}
+        counter_lock = threading.Lock()
+
+        # Only statements run for a request, the same ones the app counts in
+        # g.sql_statements; the background rollup refresh is left out
+        @event.listens_for(ospi.db.engine, 'before_cursor_execute')
+        def count_statement(*_):
+            if ospi.has_request_context():
+                with counter_lock:
+                    statement_counter['count'] += 1
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    results = {}
+    for route in [route.strip() for route in args.routes.split(',') if route.strip()]:
+        route_requests = build_requests(route, counts, args, rng)
+        results[route] = run_route(base_url, route_requests, args.concurrency, statement_counter)
+        print(f'{route}: {results[route]}', file=sys.stderr)
+
+    server.shutdown()
+    scorer.shutdown()
+    bubble.shutdown()
+
+    report = {
+        'meta': {
+            'database': database_url.split(':', 1)[0],
+            'volumes': counts,
+            'seed_seconds': round(seed_seconds, 2),
+            'concurrency': args.concurrency,
+            'bulk_rows': args.bulk_rows,
+            'update_rows': args.update_rows,
+            'scorer_latency_ms': args.scorer_latency_ms,
+            'bubble_latency_ms': args.bubble_latency_ms,
+            'python': platform.python_version()
+        },
+        'startup': startup,
+        'results': results
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
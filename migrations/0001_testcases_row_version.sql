@@ -0,0 +1,2 @@
+-- Optimistic concurrency token for test case updates
+ALTER TABLE testcases ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 1;
@@ -0,0 +1,7 @@
+-- Content-addressed, compressed storage for uploaded HTML pages
+CREATE TABLE IF NOT EXISTS htmlblobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    content BYTEA NOT NULL
+);
+ALTER TABLE htmlcodes ALTER COLUMN htmlcode DROP NOT NULL;
+ALTER TABLE htmlcodes ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64) REFERENCES htmlblobs (content_hash);
@@ -0,0 +1,3 @@
+-- Snapshot version (the row_version it was taken from) and capture time
+ALTER TABLE testcaseshistory ADD COLUMN IF NOT EXISTS version INTEGER;
+ALTER TABLE testcaseshistory ADD COLUMN IF NOT EXISTS changed_at TIMESTAMP DEFAULT now();
@@ -0,0 +1,8 @@
+-- Indexes for the filters used by the bulk import, the product listings,
+-- HTML retrieval and the version/module lookups
+CREATE INDEX IF NOT EXISTS ix_testcases_scenario_id_testcasename ON testcases (scenario_id, testcasename);
+CREATE INDEX IF NOT EXISTS ix_scenarios_module_id ON scenarios (module_id);
+CREATE INDEX IF NOT EXISTS ix_modules_productversion_id ON modules (productversion_id);
+CREATE INDEX IF NOT EXISTS ix_versions_product_id ON versions (product_id);
+CREATE INDEX IF NOT EXISTS ix_products_user_id ON products (user_id);
+CREATE INDEX IF NOT EXISTS ix_htmlcodes_module_id ON htmlcodes (module_id);
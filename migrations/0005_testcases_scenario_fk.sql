@@ -0,0 +1,4 @@
+-- testcases.scenario_id was never declared as a foreign key. NOT VALID
+-- enforces it for new rows without failing on orphans already in the table;
+-- run VALIDATE CONSTRAINT once those have been cleaned up.
+ALTER TABLE testcases ADD CONSTRAINT fk_testcases_scenario_id FOREIGN KEY (scenario_id) REFERENCES scenarios (id) NOT VALID;
@@ -0,0 +1,18 @@
+-- One test case name per module, so bulk imports can rely on
+-- INSERT ... ON CONFLICT DO NOTHING instead of reading before inserting.
+ALTER TABLE testcases ADD COLUMN IF NOT EXISTS module_id INTEGER REFERENCES modules (id);
+
+-- Backfill module_id from the scenario. Where a module already holds the
+-- same name more than once, only the oldest row gets module_id; the others
+-- keep NULL, which the unique index ignores, so no existing row is removed.
+UPDATE testcases
+SET module_id = first_rows.module_id
+FROM (
+    SELECT min(testcases.id) AS id, scenarios.module_id
+    FROM testcases
+    JOIN scenarios ON scenarios.id = testcases.scenario_id
+    GROUP BY scenarios.module_id, testcases.testcasename
+) AS first_rows
+WHERE testcases.id = first_rows.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_testcases_module_id_testcasename ON testcases (module_id, testcasename);
@@ -0,0 +1,5 @@
+-- Staging columns for set-based bulk imports through testcases_temporary
+ALTER TABLE testcases_temporary ADD COLUMN IF NOT EXISTS batch_id VARCHAR(32);
+ALTER TABLE testcases_temporary ADD COLUMN IF NOT EXISTS module_id INTEGER;
+ALTER TABLE testcases_temporary ADD COLUMN IF NOT EXISTS failure_probability DECIMAL(16, 8);
+CREATE INDEX IF NOT EXISTS ix_testcases_temporary_batch_id ON testcases_temporary (batch_id);
@@ -0,0 +1,10 @@
+-- Persistent failure-probability score cache, keyed by a hash of the
+-- product and the scoring inputs. Timestamps are epoch seconds.
+CREATE TABLE IF NOT EXISTS scorecache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    product_id INTEGER NOT NULL,
+    scored TEXT NOT NULL,
+    created_at DOUBLE PRECISION NOT NULL,
+    last_used_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_scorecache_last_used_at ON scorecache (last_used_at);
@@ -0,0 +1,2 @@
+-- Bugs are joined to their test case by the version export
+CREATE INDEX IF NOT EXISTS ix_bugs_testcases_id ON bugs (testcases_id);
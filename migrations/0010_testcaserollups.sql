@@ -0,0 +1,21 @@
+-- Precomputed test case and bug counts per scenario, module and version.
+-- Fill it after applying with: flask rollups-rebuild
+CREATE TABLE IF NOT EXISTS testcaserollups (
+    scope VARCHAR(16) NOT NULL,
+    scope_id INTEGER NOT NULL,
+    module_id INTEGER,
+    version_id INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    passed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    untested INTEGER NOT NULL DEFAULT 0,
+    bugs INTEGER NOT NULL DEFAULT 0,
+    priority_counts TEXT,
+    severity_counts TEXT,
+    fp_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    fp_count INTEGER NOT NULL DEFAULT 0,
+    updated_at DOUBLE PRECISION,
+    PRIMARY KEY (scope, scope_id)
+);
+CREATE INDEX IF NOT EXISTS ix_testcaserollups_scope_module_id ON testcaserollups (scope, module_id);
+CREATE INDEX IF NOT EXISTS ix_testcaserollups_scope_version_id ON testcaserollups (scope, version_id);
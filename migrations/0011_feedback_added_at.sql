@@ -0,0 +1,5 @@
+-- Timestamp for filtering feedback by date. Existing rows keep NULL rather
+-- than being stamped with the migration time.
+ALTER TABLE feedback ADD COLUMN IF NOT EXISTS added_at TIMESTAMP;
+ALTER TABLE feedback ALTER COLUMN added_at SET DEFAULT now();
+CREATE INDEX IF NOT EXISTS ix_feedback_added_at ON feedback (added_at);
@@ -0,0 +1,20 @@
+-- Full-text search over test cases and bugs (GET /ospi/search).
+-- A generated tsvector weights the name above the details, steps and expected
+-- results; pg_trgm backs fuzzy matches on the name.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE testcases ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(testcasename, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(testcasedetails, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(steps, '') || ' ' || coalesce(expectedresults, '')), 'C')
+) STORED;
+CREATE INDEX IF NOT EXISTS ix_testcases_search_vector ON testcases USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS ix_testcases_testcasename_trgm ON testcases USING gin (testcasename gin_trgm_ops);
+
+ALTER TABLE bugs ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(testcasename, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(testcasedetails, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(steps, '') || ' ' || coalesce(expectedresults, '')), 'C')
+) STORED;
+CREATE INDEX IF NOT EXISTS ix_bugs_search_vector ON bugs USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS ix_bugs_testcasename_trgm ON bugs USING gin (testcasename gin_trgm_ops);
@@ -0,0 +1,6 @@
+-- Imported test cases that Bubble has not accepted yet. created_at is epoch
+-- seconds.
+CREATE TABLE IF NOT EXISTS bubbleoutbox (
+    test_case_id INTEGER PRIMARY KEY,
+    created_at DOUBLE PRECISION NOT NULL
+);
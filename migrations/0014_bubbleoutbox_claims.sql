@@ -0,0 +1,4 @@
+-- Upload leases on the Bubble outbox, so concurrent uploads never send the
+-- same row twice. claimed_at is epoch seconds.
+ALTER TABLE bubbleoutbox ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(32);
+ALTER TABLE bubbleoutbox ADD COLUMN IF NOT EXISTS claimed_at DOUBLE PRECISION;
@@ -0,0 +1,36 @@
+-- The hot queries behind each endpoint, with sample parameters. Prefix each
+-- with EXPLAIN (ANALYZE, BUFFERS) on Postgres, or EXPLAIN QUERY PLAN on
+-- SQLite, before and after running the migrations; see query_plans.md.
+
+-- /ospi/testcasesbulk: duplicate check
+SELECT DISTINCT scenarios.module_id, testcases.testcasename
+FROM testcases JOIN scenarios ON scenarios.id = testcases.scenario_id
+WHERE scenarios.module_id IN (1) AND testcases.testcasename IN ('Login works', 'Logout works');
+
+-- /ospi/testcasesbulk: module -> product
+SELECT products.id FROM products
+JOIN versions ON products.id = versions.product_id
+JOIN modules ON versions.id = modules.productversion_id
+WHERE modules.id = 1 LIMIT 1;
+
+-- /ospi/users/<id>/products
+SELECT * FROM products WHERE products.user_id = 1 ORDER BY products.id;
+
+-- /ospi/users/<id>/products_withversion
+SELECT products.*, versions.id, versions.version_name
+FROM products LEFT OUTER JOIN versions ON versions.id = (
+    SELECT max(versions.id) FROM versions WHERE versions.product_id = products.id
+)
+WHERE products.user_id = 1 ORDER BY products.id;
+
+-- /ospi/products/versions/<id>
+SELECT products.id, products.chatsummary
+FROM versions LEFT OUTER JOIN products ON products.id = versions.product_id
+WHERE versions.id = 1 LIMIT 1;
+
+-- /ospi/html/<version_id>
+SELECT htmlcodes.id, htmlcodes.module_id, htmlcodes.htmlcode, htmlblobs.content
+FROM htmlcodes
+LEFT OUTER JOIN htmlblobs ON htmlblobs.content_hash = htmlcodes.content_hash
+JOIN modules ON modules.id = htmlcodes.module_id
+WHERE modules.productversion_id = 1 ORDER BY htmlcodes.id;
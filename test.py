@@ -1,38 +1,190 @@
+import atexit
+import contextlib
+import csv
+import functools
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
 import logging
 import os
+import queue
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
-from flask import Flask, request, jsonify, make_response
+from flask import Blueprint, Flask, Response, current_app, g, has_request_context, request, jsonify, make_response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from dotenv import load_dotenv
-from sqlalchemy.orm import aliased
-from sqlalchemy import func, text, desc, TIMESTAMP
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload, load_only
+from sqlalchemy import func, text, desc, TIMESTAMP, bindparam, cast, column, event, insert, inspect, or_, select, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
 import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import urlparse
+
+# Routes, request hooks and CLI commands are registered on this blueprint;
+# create_app() attaches it to an app
+bp = Blueprint('ospi', __name__, cli_group=None)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    # Same output as the default provider, encoded with orjson. Timestamps and
+    # Decimals are passed back to the default hook so they still serialize
+    # as HTTP dates and strings.
+
+    def __init__(self, app):
+        super().__init__(app)
+        import orjson
+        self.orjson = orjson
+
+    def dumps(self, obj, **kwargs):
+        orjson = self.orjson
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return self.orjson.loads(s)
+
+
+# Logging settings
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Payload logging is DEBUG only, capped in size and sampled
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))
+LOG_PAYLOAD_MAX_ITEMS = int(os.getenv('LOG_PAYLOAD_MAX_ITEMS', '20'))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '1.0'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Drops records when the queue is full instead of blocking the caller
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+log_listener = None
+
+
+def configure_logging():
+    # Handlers only enqueue records; a background listener thread does the
+    # formatting and writing so request threads never wait on log I/O.
+    # Called from create_app so the thread starts in each worker, after fork.
+    global log_listener
+    if log_listener is not None:
+        return log_listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    listener.start()
+    atexit.register(listener.stop)
+    log_listener = listener
+    return listener
+
+
+def log_payload(label, payload):
+    # Logs a request or response body at DEBUG, sampled and truncated so
+    # large imports cost a level check rather than a full dump
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    if LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+
+    size = ''
+    if isinstance(payload, (list, tuple)):
+        size = f' ({len(payload)} items)'
+        payload = list(payload[:LOG_PAYLOAD_MAX_ITEMS])
+    text_payload = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+    if len(text_payload) > LOG_PAYLOAD_MAX_CHARS:
+        text_payload = text_payload[:LOG_PAYLOAD_MAX_CHARS] + f'... [{len(text_payload)} chars]'
+    logging.debug('%s%s: %s', label, size, text_payload)
+
+
+def engine_options(database_uri):
+    # Pool and timeout settings applied to the primary and the replica
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true'),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+    }
+    if database_uri and not database_uri.startswith('sqlite'):
+        options['pool_size'] = int(os.getenv('DB_POOL_SIZE', '10'))
+        options['max_overflow'] = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+        options['pool_timeout'] = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+    if database_uri and database_uri.startswith('postgres') and statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+class RoutingSession(FlaskSession):
+    # Reads go to the replica while a read_only route is running; writes and
+    # flushes always use the primary
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only') and not self._flushing:
+            replica = db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    # Routes the view's queries to the replica, or the primary when none is set
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        db.session.info['read_only'] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@bp.teardown_app_request
+def remove_session(exception=None):
+    # Every request ends with its session closed and rolled back, including
+    # streamed responses (which tear down after the last chunk) and requests
+    # that share an outer app context, such as the async job workers
+    db.session.remove()
 
-from app import get_test_case_details
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
-aimodel_base_url = os.getenv('AIMODEL_BASE_URL')
-tc_base_url = os.getenv('TESTCASE_GENERATION_BASE_URL')
-bubble_wf_url = os.getenv('BUBBLE_WF_URL')
-bubble_data_url = os.getenv('BUBBLE_DATA_URL')
-targetted_reg_url=os.getenv('TARGETTED_REG_URL')
-CORS(app)
+session = db.session
 
 
-logging.basicConfig(
-    level=logging.DEBUG,  # Set your desired log level
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'  # Log message format
-)
+class SerializerMixin:
+    # Column attributes emitted by serialize(), in output order
+    serialize_fields = ()
 
-db = SQLAlchemy(app)
+    def serialize(self, fields=None):
+        # fields restricts the output to a projection of serialize_fields
+        return {field: getattr(self, field) for field in (fields or self.serialize_fields)}
 
-session = db.session
 
-class Users(db.Model):
+class Users(SerializerMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
     email = db.Column(db.String(255), unique=True, nullable=False)
@@ -40,80 +192,81 @@ class Users(db.Model):
     added_at = db.Column(TIMESTAMP, server_default=func.now(), nullable=False)
     feedback_displayed = db.Column(db.Boolean)
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'email': self.email,
-            'organization': self.organization,
-            'industry': self.industry,
-            # 'role_id': self.role_id,
-            # 'plan_id': self.plan_id,
-            'testcasesleft': self.testcasesleft,
-            'company_role': self.company_role,
-            'workspace_name': self.workspace_name,
-            'company_domain': self.company_domain,
-            'team_size': self.team_size,
-            'whitelisted': self.whitelisted,
-            'demo': self.demo,
-            'subscribed': self.subscribed,
-            'added_at': self.added_at,
-            'feedback_displayed': self.feedback_displayed
-        }
+    # Only columns this model maps; organization, industry, whitelisted and
+    # the other profile fields are not part of this table
+    serialize_fields = (
+        'id',
+        'name',
+        'email',
+        'testcasesleft',
+        'added_at',
+        'feedback_displayed'
+    )
 
 
 
 
 
-class ProductRequirements(db.Model):
+class ProductRequirements(SerializerMixin, db.Model):
     __tablename__ = 'productrequirements'
     id = db.Column(db.Integer, primary_key=True)
     document = db.Column(db.Text, nullable=False)
     codesnippet = db.Column(db.Text, nullable=False)
     htmlcode_id = db.Column(db.Integer, db.ForeignKey('htmlcodes.id'))
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'document': self.document,
-            'codesnippet': self.codesnippet,
-            'htmlcode_id': self.htmlcode_id
-        }
+    serialize_fields = (
+        'id',
+        'document',
+        'codesnippet',
+        'htmlcode_id'
+    )
+
 
+class HtmlBlobs(db.Model):
+    __tablename__ = 'htmlblobs'
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the raw HTML
+    content = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed HTML
 
-class HtmlCodes(db.Model):
+
+class HtmlCodes(SerializerMixin, db.Model):
     __tablename__ = 'htmlcodes'
     id = db.Column(db.Integer, primary_key=True)
-    htmlcode = db.Column(db.String, nullable=False)
-    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'))
+    htmlcode = db.Column(db.String, nullable=True)  # Raw HTML, only set on rows stored before htmlblobs
+    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), index=True)
+    content_hash = db.Column(db.String(64), db.ForeignKey('htmlblobs.content_hash'))
+    blob = db.relationship('HtmlBlobs')
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'htmlcode': self.htmlcode,
-            'module_id': self.module_id
-        }
+    serialize_fields = (
+        'id',
+        'htmlcode',
+        'module_id'
+    )
+
+    def serialize(self, fields=None):
+        data = super().serialize(fields)
+        if 'htmlcode' in data and self.content_hash is not None:
+            data['htmlcode'] = decompress_html(self.blob.content)
+        return data
 
 
 
-class Modules(db.Model):
+class Modules(SerializerMixin, db.Model):
     __tablename__ = 'modules'
     id = db.Column(db.Integer, primary_key=True)
     modulenumber = db.Column(db.Integer, nullable=False)
     modulename = db.Column(db.String(255), nullable=False)
     added_at = db.Column(TIMESTAMP, server_default=func.now(), nullable=False)
-    productversion_id = db.Column(db.Integer, db.ForeignKey('versions.id'))
+    productversion_id = db.Column(db.Integer, db.ForeignKey('versions.id'), index=True)
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'modulenumber': self.modulenumber,
-            'modulename': self.modulename,
-            'productversion_id': self.productversion_id
-        }
+    serialize_fields = (
+        'id',
+        'modulenumber',
+        'modulename',
+        'productversion_id'
+    )
 
 
-class Products(db.Model):
+class Products(SerializerMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     product_name = db.Column(db.String(255), nullable=False)
     answer1 = db.Column(db.Text)
@@ -122,39 +275,41 @@ class Products(db.Model):
     answer4 = db.Column(db.Text)
     type = db.Column(db.Text)
     chatsummary = db.Column(db.Text)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-
-    def serialize(self):
-        return {
-            'id': self.id,
-            'product_name': self.product_name,
-            'answer1': self.answer1,
-            'answer2': self.answer2,
-            'answer3': self.answer3,
-            'answer4': self.answer4,
-            'type': self.type,
-            'chatsummary': self.chatsummary
-            # Add other columns if needed for serialization
-        }
-
-class Scenarios(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+
+    serialize_fields = (
+        'id',
+        'product_name',
+        'answer1',
+        'answer2',
+        'answer3',
+        'answer4',
+        'type',
+        'chatsummary'
+    )
+
+class Scenarios(SerializerMixin, db.Model):
     __tablename__ = 'scenarios'
     id = db.Column(db.Integer, primary_key=True)
     scenarionumber = db.Column(db.Integer, nullable=False)
     scenarioname = db.Column(db.String(255), nullable=False)
-    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'))
+    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), index=True)
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'scenarionumber': self.scenarionumber,
-            'scenarioname': self.scenarioname,
-            'module_id': self.module_id
-        }
+    serialize_fields = (
+        'id',
+        'scenarionumber',
+        'scenarioname',
+        'module_id'
+    )
 
 
-class TestCases(db.Model):
+class TestCases(SerializerMixin, db.Model):
     __tablename__ = 'testcases'
+    __table_args__ = (
+        db.Index('ix_testcases_scenario_id_testcasename', 'scenario_id', 'testcasename'),
+        # Lets bulk inserts skip names already present in a module with ON CONFLICT
+        db.Index('uq_testcases_module_id_testcasename', 'module_id', 'testcasename', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     testcasenumber = db.Column(db.Integer, nullable=False)
     testcasename = db.Column(db.String(255), nullable=False)
@@ -166,27 +321,30 @@ class TestCases(db.Model):
     expectedresults = db.Column(db.Text)
     screenshoturl = db.Column(db.Text)  # New column for screenshot URL
     attachmentlink = db.Column(db.Text)  # New column for attachment link
-    scenario_id = db.Column(db.Integer)
+    scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id'))
+    module_id = db.Column(db.Integer, db.ForeignKey('modules.id'))  # Denormalised from the scenario for the unique index
     failure_probability = db.Column(db.DECIMAL(precision=16, scale=8))
-
-    def serialize(self):
-        return {
-            'id': self.id,
-            'testcasenumber': self.testcasenumber,
-            'testcasename': self.testcasename,
-            'testcasedetails': self.testcasedetails,
-            'priority': self.priority,
-            'severity': self.severity,
-            'status': self.status,
-            'steps': self.steps,
-            'expectedresults': self.expectedresults,
-            'screenshoturl': self.screenshoturl,  # Include the new columns
-            'attachmentlink': self.attachmentlink,  # Include the new columns
-            'scenario_id': self.scenario_id,
-            'failure_probability': self.failure_probability
-        }
-
-class TestCases_Temp(db.Model):
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped on every update
+
+    serialize_fields = (
+        'id',
+        'testcasenumber',
+        'testcasename',
+        'testcasedetails',
+        'priority',
+        'severity',
+        'status',
+        'steps',
+        'expectedresults',
+        'screenshoturl',
+        'attachmentlink',
+        'scenario_id',
+        'module_id',
+        'failure_probability',
+        'row_version'
+    )
+
+class TestCases_Temp(SerializerMixin, db.Model):
     __tablename__ = 'testcases_temporary'
     id = db.Column(db.Integer, primary_key=True)
     testcasename = db.Column(db.String(255), nullable=False)
@@ -199,24 +357,29 @@ class TestCases_Temp(db.Model):
     screenshoturl = db.Column(db.Text)  # New column for screenshot URL
     attachmentlink = db.Column(db.Text)  # New column for attachment link
     scenario_id = db.Column(db.Integer)
+    # Staging columns for bulk imports; rows of one import share a batch_id
+    batch_id = db.Column(db.String(32), index=True)
+    module_id = db.Column(db.Integer)
+    failure_probability = db.Column(db.DECIMAL(precision=16, scale=8))
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'testcasename': self.testcasename,
-            'testcasedetails': self.testcasedetails,
-            'priority': self.priority,
-            'severity': self.severity,
-            'status': self.status,
-            'steps': self.steps,
-            'expectedresults': self.expectedresults,
-            'screenshoturl': self.screenshoturl,  # Include the new columns
-            'attachmentlink': self.attachmentlink,  # Include the new columns
-            'scenario_id': self.scenario_id
-        }
-
-
-class TestCasesHistory(db.Model):
+    serialize_fields = (
+        'id',
+        'testcasename',
+        'testcasedetails',
+        'priority',
+        'severity',
+        'status',
+        'steps',
+        'expectedresults',
+        'screenshoturl',
+        'attachmentlink',
+        'scenario_id',
+        'module_id',
+        'failure_probability'
+    )
+
+
+class TestCasesHistory(SerializerMixin, db.Model):
     __tablename__ = 'testcaseshistory'
     id = db.Column(db.Integer, primary_key=True)
     testcasenumber = db.Column(db.Integer, nullable=False)
@@ -230,24 +393,27 @@ class TestCasesHistory(db.Model):
     scenario_id = db.Column(db.Integer, db.ForeignKey('scenarios.id'))
     parent_testcase_id = db.Column(db.Integer, db.ForeignKey('testcases.id')) # Self-referencing foreign key
     failure_probability = db.Column(db.DECIMAL(precision=16, scale=8))
-
-    def serialize(self):
-        return {
-            'id': self.id,
-            'testcasenumber': self.testcasenumber,
-            'testcasename': self.testcasename,
-            'testcasedetails': self.testcasedetails,
-            'priority': self.priority,
-            'severity': self.severity,
-            'status': self.status,
-            'steps': self.steps,
-            'expectedresults': self.expectedresults,
-            'scenario_id': self.scenario_id,
-            'parent_testcase_id': self.parent_testcase_id,
-            'failure_probability': self.failure_probability
-        }
-
-class Bugs(db.Model):
+    version = db.Column(db.Integer)  # row_version of the test case this row is a snapshot of
+    changed_at = db.Column(TIMESTAMP, server_default=func.now())
+
+    serialize_fields = (
+        'id',
+        'testcasenumber',
+        'testcasename',
+        'testcasedetails',
+        'priority',
+        'severity',
+        'status',
+        'steps',
+        'expectedresults',
+        'scenario_id',
+        'parent_testcase_id',
+        'failure_probability',
+        'version',
+        'changed_at'
+    )
+
+class Bugs(SerializerMixin, db.Model):
     __tablename__ = 'bugs'
     id = db.Column(db.Integer, primary_key=True)
     testcasenumber = db.Column(db.Integer, nullable=False)
@@ -261,44 +427,42 @@ class Bugs(db.Model):
     screenshoturl = db.Column(db.Text)  # New column for screenshot URL
     attachmentlink = db.Column(db.Text)  # New column for attachment link
     module_id = db.Column(db.Integer)
-    testcases_id = db.Column(db.Integer)
+    testcases_id = db.Column(db.Integer, index=True)
     bugnumber = db.Column(db.Integer)
     jiraselfurl = db.Column(db.Text)
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'testcasenumber': self.testcasenumber,
-            'testcasename': self.testcasename,
-            'testcasedetails': self.testcasedetails,
-            'priority': self.priority,
-            'severity': self.severity,
-            'status': self.status,
-            'steps': self.steps,
-            'expectedresults': self.expectedresults,
-            'screenshoturl': self.screenshoturl,  # Include the new columns
-            'attachmentlink': self.attachmentlink,  # Include the new columns
-            'testcases_id': self.testcases_id,
-            'module_id' : self.module_id,
-            'bugnumber': self.bugnumber,
-            'jiraselfurl': self.jiraselfurl
-        }
-
-
-class Versions(db.Model):
+    serialize_fields = (
+        'id',
+        'testcasenumber',
+        'testcasename',
+        'testcasedetails',
+        'priority',
+        'severity',
+        'status',
+        'steps',
+        'expectedresults',
+        'screenshoturl',
+        'attachmentlink',
+        'testcases_id',
+        'module_id',
+        'bugnumber',
+        'jiraselfurl'
+    )
+
+
+class Versions(SerializerMixin, db.Model):
     __tablename__ = 'versions'
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), index=True)
     version_name = db.Column(db.String(255), nullable=False)
     changes = db.Column(db.Text)
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'product_id': self.product_id,
-            'version_name': self.version_name,
-            'changes': self.changes
-        }
+    serialize_fields = (
+        'id',
+        'product_id',
+        'version_name',
+        'changes'
+    )
 
 
 class Feedback(db.Model):
@@ -306,361 +470,2727 @@ class Feedback(db.Model):
     rating = db.Column(db.Integer)
     feedback_text = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    added_at = db.Column(TIMESTAMP, server_default=func.now(), index=True)  # NULL for rows older than the column
     user = db.relationship('Users', backref=db.backref('feedback', lazy=True))
 
+    # The user fields nested in each serialized feedback row
+    user_fields = ('id', 'name', 'email')
+
     def serialize(self):
         return {
             'id': self.id,
             'rating': self.rating,
             'feedback_text': self.feedback_text,
             'user_id': self.user_id,
-            'user': self.user.serialize() if self.user else None
+            'added_at': self.added_at,
+            'user': self.user.serialize(self.user_fields) if self.user else None
         }
 
 
+class ScoreCache(db.Model):
+    # Scorer results keyed by a hash of product_id and the scoring inputs
+    __tablename__ = 'scorecache'
+    cache_key = db.Column(db.String(64), primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    scored = db.Column(db.Text, nullable=False)  # JSON list returned by the scorer
+    created_at = db.Column(db.Float, nullable=False)  # Epoch seconds
+    last_used_at = db.Column(db.Float, nullable=False, index=True)  # Epoch seconds, for LRU pruning
+
+
+class BubbleOutbox(db.Model):
+    # Imported test cases that Bubble has not accepted yet. Rows are written in
+    # the import's transaction, leased by whoever uploads them and removed as
+    # each upload chunk succeeds.
+    __tablename__ = 'bubbleoutbox'
+    test_case_id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.Float, nullable=False)  # Epoch seconds
+    claimed_by = db.Column(db.String(32))  # Lease token of the upload holding the row
+    claimed_at = db.Column(db.Float)  # Epoch seconds; the lease lapses after BUBBLE_CLAIM_TTL
+
+
+class TestCaseRollups(db.Model):
+    # Precomputed test case and bug counts per scenario, module and version
+    __tablename__ = 'testcaserollups'
+    __table_args__ = (
+        db.Index('ix_testcaserollups_scope_module_id', 'scope', 'module_id'),
+        db.Index('ix_testcaserollups_scope_version_id', 'scope', 'version_id'),
+    )
+    scope = db.Column(db.String(16), primary_key=True)  # 'scenario', 'module' or 'version'
+    scope_id = db.Column(db.Integer, primary_key=True)
+    module_id = db.Column(db.Integer)
+    version_id = db.Column(db.Integer)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    passed = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    untested = db.Column(db.Integer, nullable=False, default=0)
+    bugs = db.Column(db.Integer, nullable=False, default=0)
+    priority_counts = db.Column(db.Text)  # JSON {priority: count}
+    severity_counts = db.Column(db.Text)  # JSON {severity: count}
+    fp_sum = db.Column(db.Float, nullable=False, default=0)
+    fp_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.Float)  # Epoch seconds
+
+
+
+# Number of names sent per IN (...) list when checking for duplicates
+DEDUP_BATCH_SIZE = int(os.getenv('DEDUP_BATCH_SIZE', 500))
+
+
+def chunked(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def existing_test_case_names(module_ids, names):
+    # Returns the (module_id, testcasename) pairs that already exist, using one
+    # query per batch of names rather than one per incoming row
+    module_ids = [module_id for module_id in module_ids if module_id is not None]
+    names = [name for name in names if name is not None]
+    existing = set()
+    if not module_ids or not names:
+        return existing
+
+    for names_batch in chunked(names, DEDUP_BATCH_SIZE):
+        rows = (
+            db.session.query(Scenarios.module_id, TestCases.testcasename)
+            .join(Scenarios, Scenarios.id == TestCases.scenario_id)
+            .filter(Scenarios.module_id.in_(module_ids), TestCases.testcasename.in_(names_batch))
+            .distinct()
+            .all()
+        )
+        existing.update((row.module_id, row.testcasename) for row in rows)
+
+    return existing
+
+
+# Instrumentation. Histograms are kept in process and rendered in the
+# Prometheus text format on /metrics; SERVER_TIMING=1 also adds a
+# Server-Timing header with the request's SQL time and pipeline phases.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true')
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() in ('1', 'true')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (bucket_counts, total, count) in sorted(self._series.items()):
+                label_text = ','.join(
+                    '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in zip(self.label_names, labels)
+                )
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+                lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines)
 
-with app.app_context():
 
-    @app.route('/ospi/html/<int:version_id>', methods=['GET'])
-    def html_retrieve(version_id):
-        print('Retrieve html triggered!')
+request_duration = Histogram(
+    'ospi_request_duration_seconds', 'Time spent handling each request.',
+    ('method', 'endpoint', 'status'), LATENCY_BUCKETS
+)
+request_sql_statements = Histogram(
+    'ospi_request_sql_statements', 'SQL statements executed per request.',
+    ('method', 'endpoint'), COUNT_BUCKETS
+)
+request_sql_duration = Histogram(
+    'ospi_request_sql_duration_seconds', 'Time spent in SQL statements per request.',
+    ('method', 'endpoint'), LATENCY_BUCKETS
+)
+outbound_duration = Histogram(
+    'ospi_outbound_request_duration_seconds', 'Time until response headers for outbound HTTP calls.',
+    ('host', 'status'), LATENCY_BUCKETS
+)
+metrics = (request_duration, request_sql_statements, request_sql_duration, outbound_duration)
+
+
+@bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+    g.timing_phases = {}
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    if METRICS_ENABLED:
+        request_duration.observe(elapsed, request.method, endpoint, str(response.status_code))
+        request_sql_statements.observe(g.sql_statements, request.method, endpoint)
+        request_sql_duration.observe(g.sql_seconds, request.method, endpoint)
+    if SERVER_TIMING:
+        timings = [f'app;dur={elapsed * 1000:.1f}', f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_statements} statements"']
+        timings.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in g.timing_phases.items())
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+
+@contextlib.contextmanager
+def timed_phase(name):
+    # Adds the time spent in the block to the request's Server-Timing phases
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'timing_phases' in g:
+            g.timing_phases[name] = g.timing_phases.get(name, 0.0) + time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement_time(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['statement_started'].pop()
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+        g.sql_seconds += time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'handle_error')
+def discard_statement_timer(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get('statement_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def record_outbound_response(response, *args, **kwargs):
+    # requests response hook; elapsed covers the time until headers arrived
+    if METRICS_ENABLED:
+        outbound_duration.observe(
+            response.elapsed.total_seconds(),
+            urlparse(response.url).netloc,
+            str(response.status_code)
+        )
 
-        versions = HtmlCodes.query.filter_by(version_id=version_id).all()
 
-        return jsonify([version.serialize() for version in versions]),200
+# Outbound HTTP. Every upstream gets its own OutboundClient with a connection
+# pool, connect/read timeouts, a cap on concurrent calls, retries with
+# jittered exponential backoff and a circuit breaker. Defaults come from the
+# OUTBOUND_* variables and can be overridden per client with the client's
+# prefix, e.g. SCORER_READ_TIMEOUT or BUBBLE_WF_MAX_CONCURRENCY.
+OUTBOUND_CONNECT_TIMEOUT = float(os.getenv('OUTBOUND_CONNECT_TIMEOUT', 3.05))
+OUTBOUND_READ_TIMEOUT = float(os.getenv('OUTBOUND_READ_TIMEOUT', 30))
+OUTBOUND_MAX_CONCURRENCY = int(os.getenv('OUTBOUND_MAX_CONCURRENCY', 8))
+OUTBOUND_ACQUIRE_TIMEOUT = float(os.getenv('OUTBOUND_ACQUIRE_TIMEOUT', 10))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 2))
+OUTBOUND_RETRY_BACKOFF = float(os.getenv('OUTBOUND_RETRY_BACKOFF', 0.5))
+OUTBOUND_BREAKER_THRESHOLD = int(os.getenv('OUTBOUND_BREAKER_THRESHOLD', 5))
+OUTBOUND_BREAKER_RESET = float(os.getenv('OUTBOUND_BREAKER_RESET', 30))
+
+# Returned in place of the raw error when a call to an upstream fails
+UPSTREAM_FAILED_MESSAGE = 'Upstream service failed'
+
+# Every OutboundClient registers itself here so /ospi/outbound/stats can report it
+outbound_clients = {}
+
+
+class UpstreamUnavailable(Exception):
+    # Raised without calling the upstream: its circuit is open or all of its
+    # concurrency slots stayed busy
+    pass
+
+
+class CircuitBreaker:
+    # Opens after threshold consecutive failures and rejects calls for reset
+    # seconds, then lets a single trial call through (half open). The trial's
+    # outcome closes or re-opens the circuit.
+
+    def __init__(self, threshold, reset):
+        self.threshold = threshold
+        self.reset = reset
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+def outbound_setting(name, setting, default, cast):
+    return cast(os.getenv(f'{name.upper()}_{setting}', default))
+
+
+class OutboundClient:
+
+    def __init__(self, name, base_url_key, max_concurrency=None, max_retries=None, retry_backoff=None):
+        self.name = name
+        self.base_url_key = base_url_key
+        self.connect_timeout = outbound_setting(name, 'CONNECT_TIMEOUT', OUTBOUND_CONNECT_TIMEOUT, float)
+        self.read_timeout = outbound_setting(name, 'READ_TIMEOUT', OUTBOUND_READ_TIMEOUT, float)
+        self.max_concurrency = outbound_setting(
+            name, 'MAX_CONCURRENCY', max_concurrency or OUTBOUND_MAX_CONCURRENCY, int
+        )
+        self.acquire_timeout = outbound_setting(name, 'ACQUIRE_TIMEOUT', OUTBOUND_ACQUIRE_TIMEOUT, float)
+        self.max_retries = outbound_setting(
+            name, 'MAX_RETRIES', OUTBOUND_MAX_RETRIES if max_retries is None else max_retries, int
+        )
+        self.retry_backoff = outbound_setting(
+            name, 'RETRY_BACKOFF', OUTBOUND_RETRY_BACKOFF if retry_backoff is None else retry_backoff, float
+        )
+        self.breaker = CircuitBreaker(
+            outbound_setting(name, 'BREAKER_THRESHOLD', OUTBOUND_BREAKER_THRESHOLD, int),
+            outbound_setting(name, 'BREAKER_RESET', OUTBOUND_BREAKER_RESET, float)
+        )
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._session = None
+        self._lock = threading.Lock()
+        outbound_clients[name] = self
+
+    @property
+    def session(self):
+        # Created on first use so requests is not imported while workers boot
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                session.hooks['response'].append(record_outbound_response)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def url(self, path):
+        # Needs an app context; build URLs before handing work to other threads
+        return f'{current_app.config[self.base_url_key]}{path}'
+
+    def request(self, method, url, **kwargs):
+        # Sends the request and returns the response, raising for 4xx/5xx.
+        # Connection errors, timeouts, 429 and 5xx are retried and count
+        # towards the circuit breaker; other 4xx are returned to the caller
+        # as errors straight away.
+        import requests
+
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        session = self.session
+        for attempt in range(self.max_retries + 1):
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                self.rejected += 1
+                raise UpstreamUnavailable(f'{self.name}: all {self.max_concurrency} connections busy')
+            try:
+                if not self.breaker.allow():
+                    self.rejected += 1
+                    raise UpstreamUnavailable(f'{self.name}: circuit open')
+                self.calls += 1
+                try:
+                    response = session.request(method, url, **kwargs)
+                    response.raise_for_status()
+                except requests.HTTPError as e:
+                    if e.response.status_code != 429 and e.response.status_code < 500:
+                        self.breaker.record_success()
+                        raise
+                    error = e
+                except requests.RequestException as e:
+                    error = e
+                except BaseException:
+                    self.breaker.record_failure()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    return response
+                self.failures += 1
+                self.breaker.record_failure()
+            finally:
+                self._slots.release()
 
+            if attempt == self.max_retries:
+                raise error
+            logging.warning('%s %s failed (attempt %s): %s', self.name, method, attempt + 1, error)
+            time.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
 
-    @app.route('/ospi/users/<int:user_id>/products', methods=['GET'])
-    def get_products_for_user(user_id):
-        products = Products.query.filter_by(user_id=user_id).all()
-        db.session.remove()
-        # print(products)
-        return jsonify([product.serialize() for product in products])
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
 
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
 
-    @app.route('/ospi/users/<int:user_id>/products_withversion', methods=['GET'])
-    def get_products_for_user_with_version(user_id):
-        # Subquery to get the latest version_id for each product
-        # Subquery to get the latest version_id and version_name for each product
-        latest_version_subquery = (
-            db.session.query(
-                Versions.product_id,
-                func.max(Versions.id).label('latest_version_id'),
-                func.max(Versions.version_name).label('latest_version_name')
-            )
-            .group_by(Versions.product_id)
-            .subquery()
-        )
+    def stats(self):
+        return {
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'calls': self.calls,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'max_concurrency': self.max_concurrency,
+            'timeout': [self.connect_timeout, self.read_timeout],
+            'max_retries': self.max_retries
+        }
+
+
+# Upstreams the service is configured for but does not call yet
+aimodel_client = OutboundClient('aimodel', 'AIMODEL_BASE_URL')
+testcase_generation_client = OutboundClient('testcase_generation', 'TESTCASE_GENERATION_BASE_URL')
+bubble_wf_client = OutboundClient('bubble_wf', 'BUBBLE_WF_URL')
+
+
+# Failure-probability scorer client. SCORER_BATCH_SIZE > 1 sends that many
+# cases per request and must only be enabled when the scorer accepts a list.
+SCORER_MAX_WORKERS = int(os.getenv('SCORER_MAX_WORKERS', 8))
+SCORER_BATCH_SIZE = int(os.getenv('SCORER_BATCH_SIZE', 1))
+
+scorer_client = OutboundClient('scorer', 'TARGETTED_REG_URL', max_concurrency=SCORER_MAX_WORKERS)
+
+
+def score_test_cases(product_id, cases):
+    # Returns one list of scored cases per input case, in input order
+    if not cases:
+        return []
+    url = scorer_client.url(f'/ospi/products/one/{product_id}/versions')
+
+    def post_case(case):
+        return [scorer_client.post(url, json=case).json()]
+
+    def post_batch(batch):
+        scored = scorer_client.post(url, json=batch).json()
+        if len(scored) != len(batch):
+            raise ValueError(f'Scorer returned {len(scored)} results for {len(batch)} test cases')
+        # The scorer answers a batch with one scored case per input, in order
+        return [[case] for case in scored]
+
+    if SCORER_BATCH_SIZE > 1:
+        jobs, post = list(chunked(cases, SCORER_BATCH_SIZE)), post_batch
+    else:
+        jobs, post = [[case] for case in cases], lambda job: post_case(job[0])
+
+    # executor.map keeps results in submission order, so they line up with cases
+    with ThreadPoolExecutor(max_workers=min(SCORER_MAX_WORKERS, len(jobs))) as executor:
+        return [scored for job_result in executor.map(post, jobs) for scored in job_result]
+
+
+def insert_test_cases(rows):
+    # Inserts rows and returns the new ids. A row whose (module_id,
+    # testcasename) already exists, e.g. one added by a concurrent import, is
+    # skipped by the unique index instead of failing the whole batch.
+    if not rows:
+        return []
+    connection = db.session.connection()
+    conflict_columns = ['module_id', 'testcasename']
+    if connection.dialect.name == 'postgresql':
+        statement = postgresql.insert(TestCases.__table__).on_conflict_do_nothing(index_elements=conflict_columns)
+    elif connection.dialect.name == 'sqlite':
+        statement = sqlite.insert(TestCases.__table__).on_conflict_do_nothing(index_elements=conflict_columns)
+    else:
+        statement = insert(TestCases.__table__)
+    result = connection.execute(statement.returning(TestCases.id), rows)
+    return [row.id for row in result]
+
+
+# Imports with at least STAGING_MIN_ROWS new rows go through the
+# testcases_temporary staging table; smaller ones are inserted directly
+STAGING_MIN_ROWS = int(os.getenv('STAGING_MIN_ROWS', 1000))
+STAGING_BATCH_SIZE = int(os.getenv('STAGING_BATCH_SIZE', 500))
+STAGING_COLUMNS = (
+    'batch_id',
+    'testcasename',
+    'testcasedetails',
+    'priority',
+    'severity',
+    'status',
+    'scenario_id',
+    'module_id',
+    'failure_probability'
+)
 
-        # Query to get products, latest version_id, and latest version_name
-        products = (
+
+def copy_text_value(value):
+    # One field in COPY text format: \N is NULL, and backslash, tab and
+    # newlines are escaped
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_staging_rows(connection, rows):
+    # Streams rows into the staging table with COPY on psycopg2/psycopg 3.
+    # Returns False when the driver has no COPY support.
+    cursor = connection.connection.driver_connection.cursor()
+    copy_sql = 'COPY testcases_temporary ({}) FROM STDIN'.format(', '.join(STAGING_COLUMNS))
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write('\t'.join(copy_text_value(row[column]) for column in STAGING_COLUMNS) + '\n')
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            return True
+        if hasattr(cursor, 'copy'):
+            with cursor.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in STAGING_COLUMNS])
+            return True
+        return False
+    finally:
+        cursor.close()
+
+
+def stage_test_cases(batch_id, rows):
+    # Loads rows into testcases_temporary under batch_id: COPY on Postgres,
+    # multi-row INSERT ... VALUES of STAGING_BATCH_SIZE rows elsewhere
+    connection = db.session.connection()
+    staged = [
+        {column: row.get(column) for column in STAGING_COLUMNS if column != 'batch_id'}
+        for row in rows
+    ]
+    for row in staged:
+        row['batch_id'] = batch_id
+
+    if connection.dialect.name == 'postgresql' and copy_staging_rows(connection, staged):
+        return len(staged)
+    for rows_batch in chunked(staged, STAGING_BATCH_SIZE):
+        connection.execute(insert(TestCases_Temp.__table__).values(rows_batch))
+    return len(staged)
+
+
+def promote_staged_test_cases(batch_id):
+    # Moves one staged batch into testcases with a single INSERT ... SELECT.
+    # The first row per (module_id, testcasename) in the batch wins, names
+    # already in the module are skipped by ON CONFLICT, and the new ids come
+    # back through RETURNING in insertion order.
+    connection = db.session.connection()
+    staging = TestCases_Temp.__table__
+    columns = [
+        'testcasename',
+        'testcasedetails',
+        'priority',
+        'severity',
+        'status',
+        'scenario_id',
+        'module_id',
+        'failure_probability'
+    ]
+    first_rows = (
+        select(func.min(staging.c.id))
+        .where(staging.c.batch_id == batch_id)
+        .group_by(staging.c.module_id, staging.c.testcasename)
+    )
+    source = (
+        select(*[staging.c[column] for column in columns])
+        .where(staging.c.id.in_(first_rows))
+        .order_by(staging.c.id)
+    )
+
+    conflict_columns = ['module_id', 'testcasename']
+    if connection.dialect.name == 'postgresql':
+        statement = postgresql.insert(TestCases.__table__).on_conflict_do_nothing(index_elements=conflict_columns)
+    elif connection.dialect.name == 'sqlite':
+        statement = sqlite.insert(TestCases.__table__).on_conflict_do_nothing(index_elements=conflict_columns)
+    else:
+        statement = insert(TestCases.__table__)
+    statement = statement.from_select(columns, source).returning(TestCases.id)
+    new_ids = sorted(row.id for row in connection.execute(statement))
+
+    connection.execute(staging.delete().where(staging.c.batch_id == batch_id))
+    return new_ids
+
+
+def bulk_load_test_cases(rows):
+    # Persists scored rows and returns the new ids, staging large imports
+    if len(rows) < STAGING_MIN_ROWS:
+        return insert_test_cases(rows)
+    batch_id = uuid.uuid4().hex
+    stage_test_cases(batch_id, rows)
+    return promote_staged_test_cases(batch_id)
+
+
+# Fields of each Bubble bulk line, in output order: the test case as the
+# import stored it, then the scenario, module, version and product it sits
+# under. Internal columns (id, module_id, row_version) are not sent.
+BUBBLE_DETAIL_FIELDS = (
+    'testcasename',
+    'testcasedetails',
+    'priority',
+    'severity',
+    'status',
+    'failure_probability',
+    'scenario_id',
+    'scenarionumber',
+    'scenarioname',
+    'modulenumber',
+    'modulename',
+    'version_name',
+    'product_name'
+)
+
+
+def iter_test_case_details(test_case_ids):
+    # Yields (test_case_id, line) for each test case, in the order of
+    # test_case_ids, with one joined query per DEDUP_BATCH_SIZE ids
+    for ids_batch in chunked(test_case_ids, DEDUP_BATCH_SIZE):
+        rows = (
             db.session.query(
-                Products,
-                latest_version_subquery.c.latest_version_id,
-                latest_version_subquery.c.latest_version_name
+                TestCases.id,
+                TestCases.testcasename,
+                TestCases.testcasedetails,
+                TestCases.priority,
+                TestCases.severity,
+                TestCases.status,
+                TestCases.failure_probability,
+                TestCases.scenario_id,
+                Scenarios.scenarionumber,
+                Scenarios.scenarioname,
+                Modules.modulenumber,
+                Modules.modulename,
+                Versions.version_name,
+                Products.product_name
             )
-            .filter(Products.user_id == user_id)
-            .outerjoin(latest_version_subquery, Products.id == latest_version_subquery.c.product_id)
+            .outerjoin(Scenarios, Scenarios.id == TestCases.scenario_id)
+            .outerjoin(Modules, Modules.id == Scenarios.module_id)
+            .outerjoin(Versions, Versions.id == Modules.productversion_id)
+            .outerjoin(Products, Products.id == Versions.product_id)
+            .filter(TestCases.id.in_(ids_batch))
             .all()
         )
+        rows_by_id = {row.id: row for row in rows}
+
+        for test_case_id in ids_batch:
+            row = rows_by_id.get(test_case_id)
+            if row is None:
+                continue
+            details = {field: getattr(row, field) for field in BUBBLE_DETAIL_FIELDS}
+            if details['failure_probability'] is not None:
+                details['failure_probability'] = float(details['failure_probability'])
+            yield test_case_id, json.dumps(details)
+
+
+def get_test_case_details_bulk(test_case_ids):
+    return [line for _, line in iter_test_case_details(test_case_ids)]
+
+
+# Bubble bulk uploads are split into chunks of at most BUBBLE_CHUNK_BYTES
+# (before compression). A failed chunk is retried on its own, so chunks that
+# were already accepted are never sent twice.
+BUBBLE_CHUNK_BYTES = int(os.getenv('BUBBLE_CHUNK_BYTES', 1024 * 1024))
+BUBBLE_GZIP = os.getenv('BUBBLE_GZIP', 'false').lower() in ('1', 'true')
+BUBBLE_MAX_RETRIES = int(os.getenv('BUBBLE_MAX_RETRIES', 3))
+BUBBLE_RETRY_BACKOFF = float(os.getenv('BUBBLE_RETRY_BACKOFF', 0.5))
+# Outbox leases outlive any upload that is still running; a crashed upload's
+# rows become claimable again once theirs lapses
+BUBBLE_CLAIM_TTL = float(os.getenv('BUBBLE_CLAIM_TTL', 600))
+
+bubble_client = OutboundClient(
+    'bubble', 'BUBBLE_DATA_URL', max_concurrency=4,
+    max_retries=BUBBLE_MAX_RETRIES, retry_backoff=BUBBLE_RETRY_BACKOFF
+)
 
-        db.session.remove()
 
-        # Serialize the products, latest_version_id, and latest_version_name
-        product_data = [
-            {
-                'product_info': product[0].serialize(),
-                'latest_version_id': product[1],
-                'latest_version_name': product[2]
-            }
-            for product in products
-        ]
+def iter_line_chunks(items, max_bytes):
+    # Yields (body, ids) pairs from (id, line) items: the newline-joined lines
+    # and the ids they belong to, each body kept under max_bytes unless a
+    # single line is larger on its own
+    chunk, ids, size = [], [], 0
+    for item_id, line in items:
+        encoded = line.encode('utf-8')
+        if chunk and size + len(encoded) > max_bytes:
+            yield b'\n'.join(chunk), ids
+            chunk, ids, size = [], [], 0
+        chunk.append(encoded)
+        ids.append(item_id)
+        size += len(encoded) + 1
+    if chunk:
+        yield b'\n'.join(chunk), ids
+
+
+def upload_bubble_bulk(items, progress=None):
+    # Uploads (test_case_id, line) items and removes each accepted chunk's ids
+    # from the outbox in its own transaction, so a later failure does not
+    # put them back in line
+    progress = progress if progress is not None else {}
+    progress.setdefault('pushed', 0)
+    url = bubble_client.url('/bulk')
+
+    for body, ids in iter_line_chunks(items, BUBBLE_CHUNK_BYTES):
+        headers = {'Content-Type': 'text/plain'}
+        if BUBBLE_GZIP:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+
+        response = bubble_client.post(url, data=body, headers=headers)
+        log_payload(f'Bubble bulk chunk of {len(ids)} lines', response.text)
+        with db.engine.begin() as connection:
+            connection.execute(
+                BubbleOutbox.__table__.delete().where(BubbleOutbox.test_case_id.in_(ids))
+            )
+        progress['pushed'] += len(ids)
 
-        return jsonify(product_data)
+    return progress['pushed']
 
 
-    @app.route('/ospi/testcases/update', methods=['POST'])
-    def update_testcases():
-        data = request.get_json()
-        app.logger.info(data)
-        updated_test_cases = data.get('testCases')
-        print('updated test cases' , updated_test_cases)
+def queue_bubble_push(test_case_ids):
+    # Called in the transaction that inserts the rows, so a committed import
+    # always leaves a record of what still has to reach Bubble
+    now = time.time()
+    for ids_batch in chunked(test_case_ids, DEDUP_BATCH_SIZE):
+        db.session.execute(
+            insert(BubbleOutbox),
+            [{'test_case_id': test_case_id, 'created_at': now} for test_case_id in ids_batch]
+        )
 
-        for updated_test_case in updated_test_cases:
-            test_case_id = updated_test_case.get('id')
-            test_case = TestCases.query.get(test_case_id)
 
-            if test_case:
-                test_case.testCase = updated_test_case.get('testCase')
-                test_case.priority = updated_test_case.get('priority')
-                test_case.severity = updated_test_case.get('severity')
-                test_case.status = updated_test_case.get('status')
+def claim_bubble_outbox(module_ids=None):
+    # Leases every queued row that nobody holds, or whose lease has lapsed,
+    # with one UPDATE committed on its own connection. Concurrent claims
+    # cannot take the same row: Postgres re-checks the WHERE clause once the
+    # competing UPDATE commits, and SQLite runs one writer at a time.
+    # Returns (token, claimed ids).
+    table = BubbleOutbox.__table__
+    token = uuid.uuid4().hex
+    now = time.time()
+    test_case_ids = select(TestCases.id)
+    if module_ids is not None:
+        test_case_ids = test_case_ids.where(TestCases.module_id.in_(module_ids))
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table)
+            .where(table.c.test_case_id.in_(test_case_ids))
+            .where(or_(table.c.claimed_at.is_(None), table.c.claimed_at < now - BUBBLE_CLAIM_TTL))
+            .values(claimed_by=token, claimed_at=now)
+        )
+        claimed_ids = [
+            row.test_case_id
+            for row in connection.execute(
+                select(table.c.test_case_id).where(table.c.claimed_by == token).order_by(table.c.test_case_id)
+            )
+        ]
+    return token, claimed_ids
 
-        db.session.commit()
 
-        # Return the updated test cases if necessary
-        return jsonify(updated_test_cases),200
+def release_bubble_outbox(token):
+    # Hands rows an upload did not get to back to the queue straight away
+    table = BubbleOutbox.__table__
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(table).where(table.c.claimed_by == token).values(claimed_by=None, claimed_at=None)
+        )
 
 
-    @app.route('/ospi/testcases/updateinduvidual', methods=['POST'])
-    def update_testcase_individually():
-        try:
-            data = request.get_json()
-        #     logging.info(data)
-            test_case_id = data.get('id')
-            # test_case_id = 54952
-            logging.info(test_case_id)
-            # print(test_case_id)
-            test_case = session.get(TestCases,test_case_id)
-            # print(test_case)
-
-            description = data.get('description', None)
-            logging.info(test_case)
-            status = data.get('status')
-            # status = 'Pass'
-            print(status)
-            if status == 'Pass':
-                status = True
-            elif status == 'Fail':
-                status= False
-            else:
-                status = None
-            # app.logger.info(status)
-            if test_case:
-                test_case.testcasename = data.get('testcasename')
-                test_case.priority = data.get('priority')
-                test_case.severity = data.get('severity')
-                test_case.status = status
-                test_case.testcasedetails = description
-
-                db.session.commit()
-                updated_test_case = session.get(TestCases, test_case_id)
-
-                if updated_test_case:
-                    # Create a dictionary containing the updated test case data
-                    updated_test_case_data = {
-                        'id': updated_test_case.id,
-                        'testcasename': updated_test_case.testcasename,
-                        'priority': updated_test_case.priority,
-                        'severity': updated_test_case.severity,
-                        'status': updated_test_case.status
-                    }
-
-                    # Return the updated test case data along with the success message
-                    return jsonify(
-                        {'message': 'Test case updated successfully', 'test_case': updated_test_case_data}), 200
-                else:
-                    return jsonify({'message': 'Failed to retrieve updated test case'}), 500
-            else:
-                return jsonify({'message': 'Test case not found'}), 404
+def push_bubble_outbox(module_ids=None, progress=None):
+    # Uploads the queued test cases it can claim, only those in module_ids
+    # when given, and returns how many of them are still queued. Rows another
+    # upload holds are left to it. A Bubble failure is logged rather than
+    # raised: the rows are already committed, and whatever was not accepted
+    # stays queued for the next import into the same modules or flask
+    # bubble-push.
+    import requests
+
+    progress = progress if progress is not None else {}
+    token, claimed_ids = claim_bubble_outbox(module_ids)
+    if not claimed_ids:
+        progress['bubble_pending'] = 0
+        return 0
+    try:
+        upload_bubble_bulk(iter_test_case_details(claimed_ids), progress)
+    except (UpstreamUnavailable, requests.RequestException):
+        logging.exception('Bubble upload failed; unsent test cases stay queued')
+    finally:
+        release_bubble_outbox(token)
+    progress['bubble_pending'] = len(claimed_ids) - progress.get('pushed', 0)
+    return progress['bubble_pending']
+
+
+def blank_to_none(value):
+    # The scorer sends '' for values it has none for, which integer, boolean
+    # and numeric columns reject
+    return None if value == '' else value
+
+
+def ingest_test_cases(data, progress=None):
+    # Runs the whole bulk import: dedup, scoring, insert and Bubble upload.
+    # Row counts for each stage are recorded in progress as they complete.
+    progress = progress if progress is not None else {}
+    # List to hold all new TestCases objects
+    new_test_cases = []
+    module_id = data[0].get('module_id')
+    logging.debug('Module ID %s', module_id)
+    product_id = module_product_cache.get_or_load(module_id, load_module_product_id)
+    if product_id is None:
+        raise ValueError(f'No product found for module {module_id}')
+    progress['total'] = len(data)
+
+    # Load the names that already exist in the incoming modules in one
+    # pass instead of querying once per row
+    with timed_phase('dedup'):
+        existing_names = existing_test_case_names(
+            {row.get('module_id') for row in data},
+            {row.get('testcasename') for row in data}
+        )
+
+    # Process all rows in the data array
+    for row in data:
+        # Extract data from the row
+        testcase = row.get('testcasename')
+        priority = row.get('priority')
+        severity = row.get('severity')
+        scenario_id = row.get('scenario_id')
+        status = row.get('status')
+        testcasedetails = row.get('testcasedetails')
+        module_id = row.get('module_id')  # Add module_id to each row
+
+        # Skip names that already exist in the module, including
+        # duplicates earlier in this same payload
+        key = (module_id, testcase)
+        if key in existing_names:
+            continue
+        existing_names.add(key)
+
+        # Plain dicts rather than TestCases objects; the rows are inserted
+        # with core statements, not through the session
+        new_test_case = {
+            'testcasename': testcase,
+            'priority': priority,
+            'severity': severity,
+            'scenario_id': scenario_id,
+            'module_id': module_id,
+            'testcasedetails': testcasedetails,
+            'status': status
+        }
 
+        # Add the new test case to the list
+        new_test_cases.append(new_test_case)
+
+    module_ids = {row.get('module_id') for row in data}
+    progress['deduped'] = len(data)
+    progress['duplicates'] = len(data) - len(new_test_cases)
+
+    logging.info('%s new cases', len(new_test_cases))
+    case_dicts = [
+        {
+            "testcasename": case['testcasename'],
+            "priority": case['priority'],
+            "severity": case['severity'],
+            "scenario_id": case['scenario_id'],
+            "testcasedetails": case['testcasedetails'],
+            "status": case['status']
+        }
+        for case in new_test_cases
+    ]
+
+    # Score all new cases concurrently over the pooled scorer session
+    with timed_phase('score'):
+        new_tc_failure = score_test_cases_cached(product_id, case_dicts, progress)
+    progress['scored'] = len(new_tc_failure)
+    if new_tc_failure:
+        log_payload('Scored cases', new_tc_failure)
+        test_cases_list =[]
+        # Scores come back in input order, so each one lines up with its case
+        for new_test_case, case_list in zip(new_test_cases, new_tc_failure):
+            for case_data in case_list:
+                test_cases_list.append({
+                    'testcasename': case_data.get('testcasename', ''),
+                    'priority': case_data.get('priority', ''),
+                    'severity': case_data.get('severity', ''),
+                    'scenario_id': blank_to_none(case_data.get('scenario_id')),
+                    'module_id': new_test_case['module_id'],
+                    'testcasedetails': case_data.get('testcasedetails', ''),
+                    'status': blank_to_none(case_data.get('status')),
+                    'failure_probability': blank_to_none(case_data.get('failure_probability'))
+                })
+
+        with timed_phase('persist'):
+            new_test_case_ids = bulk_load_test_cases(test_cases_list)
+            queue_bubble_push(new_test_case_ids)
+            mark_rollups_dirty(scenario_ids={row['scenario_id'] for row in test_cases_list})
+            db.session.commit()
+        progress['persisted'] = len(new_test_case_ids)
+
+        # Stream the detail lines to Bubble in bounded chunks, along with any
+        # rows from earlier imports into these modules that never got there
+        with timed_phase('push'):
+            push_bubble_outbox(module_ids, progress)
+
+        if progress['bubble_pending']:
+            return "Added testcases; Bubble upload pending"
+        return "Added testcases"
+    else:
+        # A retried import finds nothing new, but may still have rows an
+        # earlier attempt committed without getting them to Bubble
+        with timed_phase('push'):
+            push_bubble_outbox(module_ids, progress)
+        return "No new testcases to add"
+
+
+# Background pool for /ospi/testcasesbulk?async=1. Jobs live in memory, so
+# their status is only visible on the worker process that accepted them.
+BULK_JOB_WORKERS = int(os.getenv('BULK_JOB_WORKERS', 2))
+BULK_JOB_RETENTION = int(os.getenv('BULK_JOB_RETENTION', 3600))
+
+bulk_job_executor = ThreadPoolExecutor(max_workers=BULK_JOB_WORKERS, thread_name_prefix='bulk-job')
+bulk_jobs = {}
+bulk_jobs_lock = threading.Lock()
+
+
+def run_bulk_job(app, job, data):
+    import requests
+
+    with app.app_context():
+        job['status'] = 'running'
+        try:
+            job['message'] = ingest_test_cases(data, job)
+            job['status'] = 'done'
         except Exception as e:
             db.session.rollback()
-            return jsonify({'message': 'An error occurred', 'error': str(e)}), 500
+            logging.exception('Bulk job %s failed', job['id'])
+            # The full upstream error is in the log; keep connection details
+            # out of the job status
+            job['error'] = UPSTREAM_FAILED_MESSAGE if isinstance(e, requests.RequestException) else str(e)
+            job['status'] = 'failed'
+        finally:
+            job['finished_at'] = time.time()
+
+
+def submit_bulk_job(data):
+    now = time.time()
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'total': len(data),
+        'deduped': 0,
+        'duplicates': 0,
+        'scored': 0,
+        'score_cache_hits': 0,
+        'score_cache_misses': 0,
+        'persisted': 0,
+        'pushed': 0,
+        'bubble_pending': 0,
+        'message': None,
+        'error': None,
+        'created_at': now,
+        'finished_at': None
+    }
+    with bulk_jobs_lock:
+        # Forget finished jobs once they are past the retention window
+        for job_id, old_job in list(bulk_jobs.items()):
+            if old_job['finished_at'] and now - old_job['finished_at'] > BULK_JOB_RETENTION:
+                del bulk_jobs[job_id]
+        bulk_jobs[job['id']] = job
+
+    bulk_job_executor.submit(run_bulk_job, current_app._get_current_object(), job, data)
+    return job
+
+
+def get_bulk_job(job_id):
+    with bulk_jobs_lock:
+        job = bulk_jobs.get(job_id)
+        return dict(job) if job else None
+
+
+# Test case columns an update may change, keyed by the field name clients send
+TEST_CASE_UPDATE_FIELDS = {
+    'testcasename': 'testcasename',
+    'testCase': 'testcasename',
+    'priority': 'priority',
+    'severity': 'severity',
+    'status': 'status',
+    'testcasedetails': 'testcasedetails',
+    'description': 'testcasedetails'
+}
+
+
+def parse_status(status):
+    if status == 'Pass':
+        return True
+    elif status == 'Fail':
+        return False
+    elif status is True or status is False:
+        return status
+    return None
+
+
+def test_case_changes(data):
+    # Only the fields present in data are changed; missing ones are left as is
+    changes = {
+        column: data[field]
+        for field, column in TEST_CASE_UPDATE_FIELDS.items()
+        if field in data
+    }
+    if 'status' in changes:
+        changes['status'] = parse_status(changes['status'])
+    return changes
+
+
+def test_case_update_error(data):
+    # Checks one update before any SQL runs. Returns a message for the first
+    # problem found, or None when the update can be applied.
+    test_case_id = data.get('id')
+    if isinstance(test_case_id, bool) or not isinstance(test_case_id, int):
+        return 'id must be an integer'
+    for field, column_name in TEST_CASE_UPDATE_FIELDS.items():
+        if field not in data or column_name == 'status':
+            continue
+        value = data[field]
+        column = TestCases.__table__.c[column_name]
+        if value is None:
+            if not column.nullable:
+                return f'{field} cannot be null'
+            continue
+        if not isinstance(value, str):
+            return f'{field} must be a string'
+        if column.type.length is not None and len(value) > column.type.length:
+            return f'{field} must be at most {column.type.length} characters'
+    return None
+
+
+# Columns copied from testcases into each testcaseshistory snapshot
+TEST_CASE_HISTORY_COLUMNS = (
+    'testcasenumber',
+    'testcasename',
+    'testcasedetails',
+    'priority',
+    'severity',
+    'status',
+    'steps',
+    'expectedresults',
+    'scenario_id',
+    'failure_probability'
+)
 
 
-    @app.route('/ospi/addHTML', methods=['POST'])
-    def add_html():
-        print('Add html triggered!')
-        data = request.json
+def record_test_case_history(connection, test_case_ids, expected_version=None):
+    # Snapshots the current state of test_case_ids into testcaseshistory with
+    # one INSERT ... SELECT per batch. Call it just before updating the rows;
+    # each snapshot's version is the row_version it had, so no per-row
+    # "latest version" lookup is needed.
+    for ids_batch in chunked(set(test_case_ids), DEDUP_BATCH_SIZE):
+        snapshot = (
+            select(
+                *[getattr(TestCases, column) for column in TEST_CASE_HISTORY_COLUMNS],
+                TestCases.id,
+                TestCases.row_version
+            )
+            .where(TestCases.id.in_(ids_batch))
+        )
+        if expected_version is not None:
+            snapshot = snapshot.where(TestCases.row_version == expected_version)
+        connection.execute(
+            insert(TestCasesHistory).from_select(
+                list(TEST_CASE_HISTORY_COLUMNS) + ['parent_testcase_id', 'version'],
+                snapshot
+            )
+        )
 
-        # Extract data from the request
-        html_content = data.get('html_content')
-        module_id = data.get('module_id')
 
-        # Create a new Prds object
-        new_html = HtmlCodes(
-            htmlcode = html_content,
-            module_id = module_id
+@event.listens_for(db.session, 'before_flush')
+def add_history(session, flush_context, instances):
+    # Test cases changed through the ORM get the same treatment as the bulk
+    # and individual update endpoints: one history snapshot statement per
+    # flush and a row_version bump on every modified row
+    modified = [
+        target for target in session.dirty
+        if isinstance(target, TestCases) and session.is_modified(target, include_collections=False)
+    ]
+    if not modified:
+        return
+    record_test_case_history(session.connection(), [target.id for target in modified])
+    for target in modified:
+        target.row_version = TestCases.row_version + 1
+
+
+def update_test_cases_from_values(connection, columns, mappings):
+    # UPDATE ... FROM (VALUES ...): one statement and one round trip per
+    # batch of rows. The casts type columns that are NULL in every row.
+    table = TestCases.__table__
+    for batch in chunked(mappings, DEDUP_BATCH_SIZE):
+        changes = values(
+            column('id', table.c.id.type),
+            *[column(name, table.c[name].type) for name in columns],
+            name='changes'
+        ).data([
+            (mapping['id'], *[mapping[name] for name in columns])
+            for mapping in batch
+        ])
+        connection.execute(
+            update(TestCases)
+            .where(TestCases.id == changes.c.id)
+            .values({name: cast(changes.c[name], table.c[name].type) for name in columns})
+            .values(row_version=TestCases.row_version + 1)
         )
 
-        # Add the new PRD to the database
-        db.session.add(new_html)
-        db.session.commit()
-        return jsonify({'html_id': new_html.id, 'message': 'HTML added successfully.'}), 200
 
+def bulk_update_test_cases(updates):
+    # Applies every update with one existence check per batch of ids and a
+    # single bulk UPDATE per distinct set of changed columns. Returns
+    # 'updated' or 'not found' for each entry, in input order.
+    existing_ids = set()
+    for ids_batch in chunked({entry.get('id') for entry in updates}, DEDUP_BATCH_SIZE):
+        rows = db.session.query(TestCases.id).filter(TestCases.id.in_(ids_batch)).all()
+        existing_ids.update(row.id for row in rows)
+
+    mappings = []
+    results = []
+    for entry in updates:
+        test_case_id = entry.get('id')
+        if test_case_id not in existing_ids:
+            results.append('not found')
+            continue
+        changes = test_case_changes(entry)
+        if changes:
+            mappings.append(dict(changes, id=test_case_id))
+        results.append('updated')
+
+    # Rows changing the same columns share one bulk UPDATE
+    mappings_by_columns = {}
+    for mapping in mappings:
+        columns = tuple(sorted(column for column in mapping if column != 'id'))
+        mappings_by_columns.setdefault(columns, []).append(mapping)
+
+    connection = db.session.connection()
+    record_test_case_history(connection, [mapping['id'] for mapping in mappings])
+    for columns, column_mappings in mappings_by_columns.items():
+        # psycopg2's executemany sends one statement per row; Postgres gets
+        # a VALUES list instead. Other backends (SQLite has no column list
+        # for a VALUES alias) keep the executemany.
+        if connection.dialect.name == 'postgresql':
+            update_test_cases_from_values(connection, columns, column_mappings)
+            continue
+        statement = (
+            update(TestCases)
+            .where(TestCases.id == bindparam('b_id'))
+            .values({column: bindparam(f'b_{column}') for column in columns})
+            .values(row_version=TestCases.row_version + 1)
+        )
+        connection.execute(statement, [
+            {f'b_{column}': value for column, value in mapping.items()}
+            for mapping in column_mappings
+        ])
+    mark_rollups_dirty(test_case_ids=[
+        mapping['id'] for mapping in mappings if ROLLUP_COLUMNS.intersection(mapping)
+    ])
+    db.session.commit()
+    return results
+
+
+# Columns returned to the grid after an individual update
+TEST_CASE_UPDATE_RETURNING = (
+    TestCases.id,
+    TestCases.testcasename,
+    TestCases.priority,
+    TestCases.severity,
+    TestCases.status,
+    TestCases.testcasedetails,
+    TestCases.row_version
+)
 
-    def add_history(mapper, connection, target):
-        # Get the current version number
-        last_history = TestCasesHistory.query.filter_by(testcase_id=target.id).order_by(
-            TestCasesHistory.version.desc()).first()
-        new_version = 1 if not last_history else last_history.version + 1
 
-        # Create a new history row with the old data
-        history = TestCasesHistory(
-            testcase=target.testcase,
-            priority=target.priority,
-            severity=target.severity,
-            requirementid=target.requirementid,
-            status=target.status,
-            version=new_version,
-            testcase_id=target.id,
+def update_test_case(test_case_id, changes, expected_version=None):
+    # Applies changes with a single UPDATE ... RETURNING where the backend
+    # supports it. When expected_version is given the update only applies if
+    # the row has not been changed since the caller read it.
+    # Returns (row, outcome) with outcome 'updated', 'unchanged', 'conflict'
+    # or 'not found'.
+    connection = db.session.connection()
+    current_row = select(*TEST_CASE_UPDATE_RETURNING).where(TestCases.id == test_case_id)
+
+    if not changes:
+        row = connection.execute(current_row).first()
+        return row, 'unchanged' if row else 'not found'
+
+    statement = (
+        update(TestCases)
+        .where(TestCases.id == test_case_id)
+        .values(changes)
+        .values(row_version=TestCases.row_version + 1)
+    )
+    if expected_version is not None:
+        statement = statement.where(TestCases.row_version == expected_version)
+
+    # Rolled back below along with the update if nothing ends up changing
+    record_test_case_history(connection, [test_case_id], expected_version)
+
+    dialect = connection.dialect
+    # full_returning is the pre-2.0 name of update_returning
+    supports_returning = getattr(dialect, 'update_returning', None)
+    if supports_returning is None:
+        supports_returning = getattr(dialect, 'full_returning', False)
+    if supports_returning:
+        row = connection.execute(statement.returning(*TEST_CASE_UPDATE_RETURNING)).first()
+    else:
+        result = connection.execute(statement)
+        row = connection.execute(current_row).first() if result.rowcount else None
+
+    if row is None:
+        # Nothing matched: either the row is gone or its version moved on
+        row = connection.execute(current_row).first()
+        db.session.rollback()
+        return row, 'conflict' if row else 'not found'
+
+    if ROLLUP_COLUMNS.intersection(changes):
+        mark_rollups_dirty(test_case_ids=[test_case_id])
+    db.session.commit()
+    return row, 'updated'
+
+
+# Rollups hold test case counts by status, priority and severity, bug counts
+# and the failure_probability sum per scenario; module and version rows are
+# sums of the rows below them. Write paths mark what they touched; after the
+# commit the ids go on rollup_queue and a background thread recomputes the
+# affected rollups, so the writing request does no rollup work itself.
+ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'true').lower() in ('1', 'true')
+# Test case columns that feed the rollups
+ROLLUP_COLUMNS = {'status', 'priority', 'severity', 'scenario_id', 'failure_probability'}
+
+
+def mark_rollups_dirty(scenario_ids=(), test_case_ids=(), module_ids=()):
+    # Records ids whose rollups must be refreshed once the session commits
+    if not ROLLUPS_ENABLED:
+        return
+    dirty = db.session.info.setdefault('rollups_dirty', {
+        'scenario_ids': set(),
+        'test_case_ids': set(),
+        'module_ids': set()
+    })
+    dirty['scenario_ids'].update(i for i in scenario_ids if i not in (None, ''))
+    dirty['test_case_ids'].update(i for i in test_case_ids if i is not None)
+    dirty['module_ids'].update(i for i in module_ids if i is not None)
+
+
+def empty_rollup():
+    return {
+        'total': 0,
+        'passed': 0,
+        'failed': 0,
+        'untested': 0,
+        'bugs': 0,
+        'priority_counts': {},
+        'severity_counts': {},
+        'fp_sum': 0.0,
+        'fp_count': 0
+    }
+
+
+def add_rollup(total, part):
+    for key in ('total', 'passed', 'failed', 'untested', 'bugs', 'fp_sum', 'fp_count'):
+        total[key] += part[key]
+    for key in ('priority_counts', 'severity_counts'):
+        for value, count in part[key].items():
+            total[key][value] = total[key].get(value, 0) + count
+    return total
+
+
+def rollup_from_row(row):
+    rollup = {key: getattr(row, key) for key in ('total', 'passed', 'failed', 'untested', 'bugs', 'fp_sum', 'fp_count')}
+    rollup['priority_counts'] = json.loads(row.priority_counts or '{}')
+    rollup['severity_counts'] = json.loads(row.severity_counts or '{}')
+    return rollup
+
+
+def save_rollups(connection, scope, rollups):
+    # Upserts {scope_id: (module_id, version_id, rollup)} for one scope
+    if not rollups:
+        return
+    now = time.time()
+    rows = [
+        dict(
+            rollup,
+            scope=scope,
+            scope_id=scope_id,
+            module_id=module_id,
+            version_id=version_id,
+            priority_counts=json.dumps(rollup['priority_counts'], sort_keys=True),
+            severity_counts=json.dumps(rollup['severity_counts'], sort_keys=True),
+            updated_at=now
+        )
+        for scope_id, (module_id, version_id, rollup) in rollups.items()
+    ]
+    table = TestCaseRollups.__table__
+    if connection.dialect.name in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['scope', 'scope_id'],
+            set_={
+                column.name: statement.excluded[column.name]
+                for column in table.columns
+                if column.name not in ('scope', 'scope_id')
+            }
+        )
+        connection.execute(statement, rows)
+    else:
+        connection.execute(
+            table.delete()
+            .where(table.c.scope == scope)
+            .where(table.c.scope_id.in_(list(rollups)))
+        )
+        connection.execute(insert(table), rows)
+
+
+def refresh_scenario_rollups(connection, scenario_ids):
+    # Recomputes the given scenarios from testcases and bugs; returns the
+    # ids of their modules
+    module_ids = set()
+    for ids_batch in chunked(scenario_ids, DEDUP_BATCH_SIZE):
+        rollups = {}
+        placement = connection.execute(
+            select(Scenarios.id, Scenarios.module_id, Modules.productversion_id)
+            .outerjoin(Modules, Modules.id == Scenarios.module_id)
+            .where(Scenarios.id.in_(ids_batch))
+        )
+        for scenario_id, module_id, version_id in placement:
+            rollups[scenario_id] = (module_id, version_id, empty_rollup())
+            module_ids.add(module_id)
+
+        counts = connection.execute(
+            select(
+                TestCases.scenario_id,
+                TestCases.status,
+                TestCases.priority,
+                TestCases.severity,
+                func.count(),
+                func.sum(TestCases.failure_probability),
+                func.count(TestCases.failure_probability)
+            )
+            .where(TestCases.scenario_id.in_(ids_batch))
+            .group_by(TestCases.scenario_id, TestCases.status, TestCases.priority, TestCases.severity)
+        )
+        for scenario_id, status, priority, severity, count, fp_sum, fp_count in counts:
+            if scenario_id not in rollups:
+                continue
+            rollup = rollups[scenario_id][2]
+            rollup['total'] += count
+            rollup['passed' if status is True else 'failed' if status is False else 'untested'] += count
+            rollup['priority_counts'][priority] = rollup['priority_counts'].get(priority, 0) + count
+            rollup['severity_counts'][severity] = rollup['severity_counts'].get(severity, 0) + count
+            rollup['fp_sum'] += float(fp_sum or 0)
+            rollup['fp_count'] += fp_count
+
+        bug_counts = connection.execute(
+            select(TestCases.scenario_id, func.count(Bugs.id))
+            .join(TestCases, TestCases.id == Bugs.testcases_id)
+            .where(TestCases.scenario_id.in_(ids_batch))
+            .group_by(TestCases.scenario_id)
         )
+        for scenario_id, count in bug_counts:
+            if scenario_id in rollups:
+                rollups[scenario_id][2]['bugs'] = count
+
+        save_rollups(connection, 'scenario', rollups)
+    module_ids.discard(None)
+    return module_ids
+
+
+def refresh_module_rollups(connection, module_ids):
+    # Sums the scenario rollups of each module, plus bugs filed against the
+    # module without a test case; returns the ids of their versions
+    table = TestCaseRollups.__table__
+    version_ids = set()
+    for ids_batch in chunked(module_ids, DEDUP_BATCH_SIZE):
+        rollups = {}
+        placement = connection.execute(
+            select(Modules.id, Modules.productversion_id).where(Modules.id.in_(ids_batch))
+        )
+        for module_id, version_id in placement:
+            rollups[module_id] = (module_id, version_id, empty_rollup())
+            version_ids.add(version_id)
+
+        scenario_rows = connection.execute(
+            select(table).where(table.c.scope == 'scenario').where(table.c.module_id.in_(ids_batch))
+        )
+        for row in scenario_rows:
+            if row.module_id in rollups:
+                add_rollup(rollups[row.module_id][2], rollup_from_row(row))
+
+        bug_counts = connection.execute(
+            select(Bugs.module_id, func.count(Bugs.id))
+            .where(Bugs.testcases_id.is_(None))
+            .where(Bugs.module_id.in_(ids_batch))
+            .group_by(Bugs.module_id)
+        )
+        for module_id, count in bug_counts:
+            if module_id in rollups:
+                rollups[module_id][2]['bugs'] += count
 
-        db.session.add(history)
+        save_rollups(connection, 'module', rollups)
+    version_ids.discard(None)
+    return version_ids
 
 
-    @app.route('/ospi/addVersion', methods=['POST'])
-    def add_version():
+def refresh_version_rollups(connection, version_ids):
+    # Sums the module rollups of each version
+    table = TestCaseRollups.__table__
+    for ids_batch in chunked(version_ids, DEDUP_BATCH_SIZE):
+        rollups = {}
+        for (version_id,) in connection.execute(select(Versions.id).where(Versions.id.in_(ids_batch))):
+            rollups[version_id] = (None, version_id, empty_rollup())
 
-        data = request.get_json()
-        print("DB ADD Version: ", data)
-        new_version = Versions(
-            product_id = data.get('productId'),
-            version_name =  data.get('version_name'),
-            changes =  data.get('changes')
+        module_rows = connection.execute(
+            select(table).where(table.c.scope == 'module').where(table.c.version_id.in_(ids_batch))
         )
+        for row in module_rows:
+            if row.version_id in rollups:
+                add_rollup(rollups[row.version_id][2], rollup_from_row(row))
 
-        db.session.add(new_version)
-        db.session.commit()
+        save_rollups(connection, 'version', rollups)
 
-        return jsonify({"message": "OK", "version_id": new_version.id}), 200
 
+def refresh_rollups(connection, scenario_ids=(), test_case_ids=(), module_ids=()):
+    scenario_ids = set(scenario_ids)
+    for ids_batch in chunked(test_case_ids, DEDUP_BATCH_SIZE):
+        rows = connection.execute(
+            select(TestCases.scenario_id).where(TestCases.id.in_(ids_batch)).distinct()
+        )
+        scenario_ids.update(row.scenario_id for row in rows if row.scenario_id is not None)
+    module_ids = set(module_ids) | refresh_scenario_rollups(connection, scenario_ids)
+    refresh_version_rollups(connection, refresh_module_rollups(connection, module_ids))
+
+
+@event.listens_for(TestCases, 'after_insert')
+@event.listens_for(TestCases, 'after_update')
+@event.listens_for(TestCases, 'after_delete')
+def mark_test_case_rollups(mapper, connection, target):
+    # ORM writes; a test case moved to another scenario dirties both
+    history = inspect(target).attrs.scenario_id.history
+    mark_rollups_dirty(scenario_ids=[target.scenario_id, *(history.deleted or ())])
+
+
+@event.listens_for(Bugs, 'after_insert')
+@event.listens_for(Bugs, 'after_update')
+@event.listens_for(Bugs, 'after_delete')
+def mark_bug_rollups(mapper, connection, target):
+    mark_rollups_dirty(test_case_ids=[target.testcases_id], module_ids=[target.module_id])
+
+
+# Postgres advisory lock key taken by every rollup refresh
+ROLLUP_LOCK_KEY = zlib.crc32(b'testcaserollups')
+
+rollup_queue = queue.Queue()
+rollup_worker = None
+rollup_worker_lock = threading.Lock()
+
+
+def lock_rollups(connection):
+    # Serialises refreshes across worker processes until the transaction
+    # ends. Each refresh then reads after the previous one committed, so an
+    # older count can never overwrite a newer one.
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': ROLLUP_LOCK_KEY})
+
+
+def run_rollup_worker():
+    # Takes everything queued so far, merges it into one refresh per app and
+    # runs it on its own connection. A failure leaves rollups stale rather
+    # than failing the requests that wrote.
+    while True:
+        items = [rollup_queue.get()]
+        while True:
+            try:
+                items.append(rollup_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            merged = {}
+            for app, dirty in items:
+                app_dirty = merged.setdefault(app, {'scenario_ids': set(), 'test_case_ids': set(), 'module_ids': set()})
+                for key, ids in dirty.items():
+                    app_dirty[key].update(ids)
+            for app, dirty in merged.items():
+                with app.app_context(), db.engine.begin() as connection:
+                    lock_rollups(connection)
+                    refresh_rollups(connection, **dirty)
+        except Exception:
+            logging.exception('Rollup refresh failed; run flask rollups-rebuild to repair')
+        finally:
+            for _ in items:
+                rollup_queue.task_done()
+
+
+def start_rollup_worker():
+    global rollup_worker
+    with rollup_worker_lock:
+        if rollup_worker is None or not rollup_worker.is_alive():
+            rollup_worker = threading.Thread(target=run_rollup_worker, name='rollup-refresh', daemon=True)
+            rollup_worker.start()
+
+
+@event.listens_for(db.session, 'after_commit')
+def queue_dirty_rollups(session):
+    # Refreshes still queued when the process exits are lost; flask
+    # rollups-rebuild repairs them
+    dirty = session.info.pop('rollups_dirty', None)
+    if not dirty:
+        return
+    rollup_queue.put((current_app._get_current_object(), dirty))
+    start_rollup_worker()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_dirty_rollups(session):
+    session.info.pop('rollups_dirty', None)
+
+
+def rollup_summary(row):
+    rollup = rollup_from_row(row) if row is not None else empty_rollup()
+    return {
+        'total': rollup['total'],
+        'passed': rollup['passed'],
+        'failed': rollup['failed'],
+        'untested': rollup['untested'],
+        'bugs': rollup['bugs'],
+        'by_priority': rollup['priority_counts'],
+        'by_severity': rollup['severity_counts'],
+        'avg_failure_probability': rollup['fp_sum'] / rollup['fp_count'] if rollup['fp_count'] else None
+    }
+
+
+# The ORM events below only invalidate entries in the process that made the
+# write. Other workers (gunicorn -w N) and writes made outside this app are
+# seen once the entry expires, so CACHE_TTL is the staleness bound for
+# chat summaries and module products.
+CACHE_TTL = float(os.getenv('CACHE_TTL', 30))
+CACHE_MAXSIZE = int(os.getenv('CACHE_MAXSIZE', 4096))
+
+# Every TTLCache registers itself here so /ospi/cache/stats can report it
+caches = {}
+
+
+class TTLCache:
+    # Thread-safe read-through cache. Entries expire after ttl seconds and the
+    # least recently used entry is dropped once maxsize is reached.
+
+    def __init__(self, name, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, key):
+        # Returns the cached value for key, or None on a miss
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def get_or_load(self, key, loader):
+        # Returns the cached value for key, calling loader(key) on a miss.
+        # None results are not cached so missing rows are looked up again.
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        value = loader(key)
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        # Drops every entry for which predicate(key, value) is true
+        with self._lock:
+            for key, (_, value) in list(self._entries.items()):
+                if predicate(key, value):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None
+            }
 
-    @app.route('/ospi/products/versions/<int:version_id>', methods=['GET'])
-    def get_chat_summary_for_version(version_id):
-        version = Versions.query.filter_by(id=version_id).first()
-        if version is not None:
-            product = Products.query.filter_by(id=version.product_id).first()
-            if product is not None:
-                print('Chat summary found:', product.chatsummary)
-                return jsonify({'chatsummary': product.chatsummary}), 200
-            else:
-                print('Product not found for the version')
-                return jsonify({'message': 'Product not found for the version'}), 400
-        else:
-            print('Version not found')
-            return jsonify({'message': 'Version not found'}), 400
 
+chat_summary_cache = TTLCache('chat_summary')
+module_product_cache = TTLCache('module_product')
 
-    @app.route('/ospi/testcasesbulk', methods=['POST'])
-    def add_test_cases_bulk():
 
-        try:
-            data = request.json
-            print(data)
-            # List to hold all new TestCases objects
-            new_test_cases = []
-            module_id = data[0].get('module_id')
-            print("Module ID", module_id)
-            result = (
-                session.query(Products.id.label('product_id'))
-                .join(Versions, Products.id == Versions.product_id)
-                .join(Modules, Versions.id == Modules.productversion_id)
-                .filter(Modules.id == module_id)
-                .first()
-            )
+def load_chat_summary(version_id):
+    # Version and its product's chat summary in one query; product_id is None
+    # when the version points at a missing product
+    row = (
+        db.session.query(Products.id, Products.chatsummary)
+        .select_from(Versions)
+        .outerjoin(Products, Products.id == Versions.product_id)
+        .filter(Versions.id == version_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return {'product_id': row[0], 'chatsummary': row[1]}
 
-            product_id = result.product_id
-
-            # Process all rows in the data array
-            for row in data:
-                # Extract data from the row
-                testcase = row.get('testcasename')
-                priority = row.get('priority')
-                severity = row.get('severity')
-                scenario_id = row.get('scenario_id')
-                status = row.get('status')
-                testcasedetails = row.get('testcasedetails')
-                module_id = row.get('module_id')  # Add module_id to each row
-
-
-                # Check if a TestCases entry with the same name exists in the same module
-                existing_test_case = (
-                    db.session.query(TestCases)
-                    .join(Scenarios, Scenarios.id == TestCases.scenario_id)
-                    .join(Modules, Modules.id == Scenarios.module_id)
-                    .filter(Modules.id == module_id, TestCases.testcasename == testcase)
-                    .first()
-                )
 
-                if existing_test_case:
-                    # Skip this row and move on to the next one
-                    continue
-
-                # Create a new TestCases object
-                new_test_case = TestCases(
-                    testcasename=testcase,
-                    priority=priority,
-                    severity=severity,
-                    scenario_id=scenario_id,
-                    testcasedetails=testcasedetails,
-                    status=status
-                )
+def load_module_product_id(module_id):
+    row = (
+        db.session.query(Products.id.label('product_id'))
+        .join(Versions, Products.id == Versions.product_id)
+        .join(Modules, Versions.id == Modules.productversion_id)
+        .filter(Modules.id == module_id)
+        .first()
+    )
+    return row.product_id if row else None
 
-                # Add the new test case to the list
-                new_test_cases.append(new_test_case)
 
-            new_tc_failure =[]
-            a = []
-            logging.info("New cases")
-            for case in new_test_cases:
-                case_dict = {
-                    "testcasename": case.testcasename,
-                    "priority": case.priority,
-                    "severity": case.severity,
-                    "scenario_id": case.scenario_id,
-                    "testcasedetails": case.testcasedetails,
-                    "status": case.status
-                }
+def attribute_changed(target, name):
+    return inspect(target).attrs[name].history.has_changes()
 
-                # print(case_dict)
 
-                # Send the dictionary as JSON in the request
-                response = requests.post(f'{targetted_reg_url}/ospi/products/one/{product_id}/versions', json=case_dict)
+# Keep this process's caches in step with its own ORM writes to the rows they
+# are built from. Inserts need nothing: a missing row is never cached.
+@event.listens_for(Products, 'after_update')
+def invalidate_updated_product_caches(mapper, connection, target):
+    chat_summary_cache.invalidate_where(lambda key, value: value['product_id'] == target.id)
 
 
-                case = response.json()
-                new_tc_failure.append(case)
-            if new_tc_failure:
-                print(new_tc_failure)
-                test_cases_list =[]
-                for case_list in new_tc_failure:
-                    for case_data in case_list:
-                        new_test_case = TestCases(
-                            testcasename=case_data.get('testcasename', ''),
-                            priority=case_data.get('priority', ''),
-                            severity=case_data.get('severity', ''),
-                            scenario_id=case_data.get('scenario_id', ''),
-                            testcasedetails=case_data.get('testcasedetails', ''),
-                            status=case_data.get('status', ''),
-                            failure_probability=case_data.get('failure_probability', '')
-                        )
+@event.listens_for(Products, 'after_delete')
+def invalidate_deleted_product_caches(mapper, connection, target):
+    chat_summary_cache.invalidate_where(lambda key, value: value['product_id'] == target.id)
+    module_product_cache.invalidate_where(lambda key, value: value == target.id)
 
-                        test_cases_list.append(new_test_case)
 
-                db.session.add_all(test_cases_list)
-                db.session.commit()  # This will persist the new_test_case and assign it an ID
+@event.listens_for(Versions, 'after_update')
+def invalidate_updated_version_caches(mapper, connection, target):
+    if attribute_changed(target, 'product_id'):
+        chat_summary_cache.invalidate(target.id)
+        # Which modules sit under the version is not cached, so drop them all
+        module_product_cache.clear()
 
-                for new_test_case in test_cases_list:
-                    print(f'TestCase ID: {new_test_case.id}, TestCasename: {new_test_case.testcasename}')
-                # Access the ID after commit
 
+@event.listens_for(Versions, 'after_delete')
+def invalidate_deleted_version_caches(mapper, connection, target):
+    chat_summary_cache.invalidate(target.id)
+    module_product_cache.clear()
 
-                    print(case_data)
 
+@event.listens_for(Modules, 'after_update')
+def invalidate_updated_module_caches(mapper, connection, target):
+    if attribute_changed(target, 'productversion_id'):
+        module_product_cache.invalidate(target.id)
 
-                    all_details = get_test_case_details(new_test_case.id)
 
-                    a.append(all_details)
+@event.listens_for(Modules, 'after_delete')
+def invalidate_deleted_module_caches(mapper, connection, target):
+    module_product_cache.invalidate(target.id)
 
 
-                    # Join the details with newline characters
-                data = "\n".join(a)
-                print(data)
+# Scores are reused for identical (product, name, details, priority,
+# severity) inputs. The scorecache table holds up to SCORE_CACHE_MAXSIZE
+# entries for SCORE_CACHE_TTL seconds, with an in-process TTLCache in front.
+SCORE_CACHE_ENABLED = os.getenv('SCORE_CACHE_ENABLED', 'true').lower() in ('1', 'true')
+SCORE_CACHE_TTL = float(os.getenv('SCORE_CACHE_TTL', 7 * 24 * 3600))
+SCORE_CACHE_MAXSIZE = int(os.getenv('SCORE_CACHE_MAXSIZE', 100000))
+SCORE_CACHE_PRUNE_INTERVAL = float(os.getenv('SCORE_CACHE_PRUNE_INTERVAL', 300))
+SCORE_CACHE_KEY_FIELDS = ('testcasename', 'testcasedetails', 'priority', 'severity')
 
-                url = f'{bubble_data_url}/bulk'
-                headers = {'Content-Type': 'text/plain'}
+# Scores are keyed by their inputs and never go stale, so this TTL only has
+# to stay within SCORE_CACHE_TTL
+SCORE_CACHE_MEMORY_TTL = float(os.getenv('SCORE_CACHE_MEMORY_TTL', 300))
+score_cache = TTLCache('score', ttl=min(SCORE_CACHE_MEMORY_TTL, SCORE_CACHE_TTL))
+score_cache_pruned_at = 0
 
-                # Send the data in one bulk request
-                response = requests.post(url, data=data, headers=headers)
 
-                print(response.text)
+def score_cache_key(product_id, case):
+    inputs = [product_id] + [case.get(field) for field in SCORE_CACHE_KEY_FIELDS]
+    return hashlib.sha256(json.dumps(inputs, default=str).encode('utf-8')).hexdigest()
 
-                return jsonify({"message": "Added testcases"}), 200
-            else:
-                return jsonify({"message": "No new testcases to add"}), 200
-        except Exception as e:
-            return jsonify({"error": str(e)}), 400
+
+def load_cached_scores(keys):
+    # Returns {cache_key: scored} for the keys stored within the TTL and marks
+    # them as used
+    found = {}
+    if not keys:
+        return found
+    now = time.time()
+    table = ScoreCache.__table__
+    # A separate connection, so cache reads and writes are not tied to the
+    # import's transaction
+    with db.engine.begin() as connection:
+        for keys_batch in chunked(keys, DEDUP_BATCH_SIZE):
+            rows = connection.execute(
+                select(table.c.cache_key, table.c.scored)
+                .where(table.c.cache_key.in_(keys_batch))
+                .where(table.c.created_at > now - SCORE_CACHE_TTL)
+            )
+            found.update((row.cache_key, json.loads(row.scored)) for row in rows)
+        for keys_batch in chunked(found, DEDUP_BATCH_SIZE):
+            connection.execute(
+                update(table).where(table.c.cache_key.in_(keys_batch)).values(last_used_at=now)
+            )
+    return found
+
+
+def store_cached_scores(product_id, scored_by_key):
+    # Saves new scorer results; keys stored concurrently by another import
+    # are left as they are
+    if not scored_by_key:
+        return
+    now = time.time()
+    rows = [
+        {
+            'cache_key': key,
+            'product_id': product_id,
+            'scored': json.dumps(scored, default=str),
+            'created_at': now,
+            'last_used_at': now
+        }
+        for key, scored in scored_by_key.items()
+    ]
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            statement = postgresql.insert(ScoreCache.__table__).on_conflict_do_nothing()
+        elif connection.dialect.name == 'sqlite':
+            statement = sqlite.insert(ScoreCache.__table__).on_conflict_do_nothing()
+        else:
+            statement = insert(ScoreCache.__table__)
+        connection.execute(statement, rows)
+    prune_score_cache()
+
+
+def prune_score_cache(force=False):
+    # Drops expired entries, then the least recently used ones beyond
+    # SCORE_CACHE_MAXSIZE. Runs at most once per SCORE_CACHE_PRUNE_INTERVAL.
+    global score_cache_pruned_at
+    now = time.time()
+    if not force and now - score_cache_pruned_at < SCORE_CACHE_PRUNE_INTERVAL:
+        return
+    score_cache_pruned_at = now
+
+    table = ScoreCache.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.delete().where(table.c.created_at <= now - SCORE_CACHE_TTL))
+        overflow = (
+            select(table.c.cache_key)
+            .order_by(table.c.last_used_at.desc())
+            .offset(SCORE_CACHE_MAXSIZE)
+        )
+        connection.execute(table.delete().where(table.c.cache_key.in_(overflow)))
+
+
+def score_test_cases_cached(product_id, cases, progress):
+    # Same result as score_test_cases, but only cases with no cached score
+    # are sent to the scorer. Hit and miss counts are added to progress.
+    if not SCORE_CACHE_ENABLED:
+        progress['score_cache_hits'] = 0
+        progress['score_cache_misses'] = len(cases)
+        return score_test_cases(product_id, cases)
+
+    keys = [score_cache_key(product_id, case) for case in cases]
+    cached = {}
+    for key in set(keys):
+        scored = score_cache.get(key)
+        if scored is not None:
+            cached[key] = scored
+    stored = load_cached_scores([key for key in set(keys) if key not in cached])
+    for key, scored in stored.items():
+        score_cache.set(key, scored)
+    cached.update(stored)
+
+    # Identical cases in one import are scored once
+    miss_keys = list(dict.fromkeys(key for key in keys if key not in cached))
+    miss_cases = {}
+    for key, case in zip(keys, cases):
+        if key not in cached:
+            miss_cases.setdefault(key, case)
+    scored_misses = dict(zip(miss_keys, score_test_cases(product_id, [miss_cases[key] for key in miss_keys])))
+    store_cached_scores(product_id, scored_misses)
+    for key, scored in scored_misses.items():
+        score_cache.set(key, scored)
+
+    progress['score_cache_hits'] = len(keys) - len(miss_keys)
+    progress['score_cache_misses'] = len(miss_keys)
+
+    results = []
+    for key, case in zip(keys, cases):
+        if key in scored_misses and miss_cases[key] is case:
+            results.append(scored_misses[key])
+            continue
+        # Fields outside the cache key come from this case, not the one the
+        # score was first computed for
+        scored_list = cached[key] if key in cached else scored_misses[key]
+        results.append([
+            dict(scored, scenario_id=case.get('scenario_id'), status=case.get('status'))
+            for scored in scored_list
+        ])
+    return results
+
+
+def requested_fields(model):
+    # Parses ?fields=a,b into the subset of model.serialize_fields to return.
+    # id is always included; None means no projection was requested.
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    wanted = {field.strip() for field in fields.split(',')}
+    return tuple(
+        field for field in model.serialize_fields
+        if field in wanted or field == 'id'
+    )
+
+
+def project(query, model, fields):
+    # Pushes a ?fields= projection down into the SELECT so unrequested
+    # columns (large text blobs in particular) are never loaded
+    if fields is None:
+        return query
+    return query.options(load_only(*[getattr(model, field) for field in fields]))
+
+
+HTML_COMPRESSION_LEVEL = int(os.getenv('HTML_COMPRESSION_LEVEL', 6))
+HTML_FETCH_SIZE = int(os.getenv('HTML_FETCH_SIZE', 20))
+
+
+def decompress_html(content):
+    return zlib.decompress(content).decode('utf-8')
+
+
+def store_html_blob(html_content):
+    # Stores html_content once per distinct content and returns its hash
+    content_hash = hashlib.sha256(html_content.encode('utf-8')).hexdigest()
+    # Only the key is read; loading the row would pull in the whole blob
+    exists = db.session.execute(
+        select(HtmlBlobs.content_hash).where(HtmlBlobs.content_hash == content_hash)
+    ).first()
+    if exists is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(HtmlBlobs(
+                    content_hash=content_hash,
+                    content=zlib.compress(html_content.encode('utf-8'), HTML_COMPRESSION_LEVEL)
+                ))
+        except IntegrityError:
+            # Another request stored the same content first
+            pass
+    return content_hash
+
+
+def iter_html_json(statement):
+    # Streams the rows of statement as a JSON array, one row in memory at a time
+    yield '['
+    dumps = current_app.json.dumps
+    rows = db.session.execute(statement.execution_options(yield_per=HTML_FETCH_SIZE))
+    for index, row in enumerate(rows):
+        htmlcode = decompress_html(row.content) if row.content is not None else row.htmlcode
+        yield (',' if index else '') + dumps({
+            'id': row.id,
+            'htmlcode': htmlcode,
+            'module_id': row.module_id
+        })
+    yield ']'
+
+
+# Rows fetched per round trip by the test case export, and rows written per
+# streamed chunk
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 1000))
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 500))
+EXPORT_COLUMNS = (
+    ('version_id', Modules.productversion_id),
+    ('module_id', Modules.id),
+    ('modulenumber', Modules.modulenumber),
+    ('modulename', Modules.modulename),
+    ('scenario_id', Scenarios.id),
+    ('scenarionumber', Scenarios.scenarionumber),
+    ('scenarioname', Scenarios.scenarioname),
+    ('testcase_id', TestCases.id),
+    ('testcasenumber', TestCases.testcasenumber),
+    ('testcasename', TestCases.testcasename),
+    ('testcasedetails', TestCases.testcasedetails),
+    ('priority', TestCases.priority),
+    ('severity', TestCases.severity),
+    ('status', TestCases.status),
+    ('steps', TestCases.steps),
+    ('expectedresults', TestCases.expectedresults),
+    ('screenshoturl', TestCases.screenshoturl),
+    ('attachmentlink', TestCases.attachmentlink),
+    ('failure_probability', TestCases.failure_probability),
+    ('row_version', TestCases.row_version)
+)
+EXPORT_BUG_COLUMNS = (
+    ('bug_id', Bugs.id),
+    ('bugnumber', Bugs.bugnumber),
+    ('bug_testcasename', Bugs.testcasename),
+    ('bug_priority', Bugs.priority),
+    ('bug_severity', Bugs.severity),
+    ('bug_status', Bugs.status),
+    ('jiraselfurl', Bugs.jiraselfurl)
+)
+
+
+def version_export_rows(version_id, include_bugs):
+    # Version -> modules -> scenarios -> test cases (-> bugs) in tree order,
+    # read through a server-side cursor EXPORT_FETCH_SIZE rows at a time
+    columns = EXPORT_COLUMNS + (EXPORT_BUG_COLUMNS if include_bugs else ())
+    statement = (
+        select(*[column.label(name) for name, column in columns])
+        .select_from(Modules)
+        .join(Scenarios, Scenarios.module_id == Modules.id)
+        .join(TestCases, TestCases.scenario_id == Scenarios.id)
+        .where(Modules.productversion_id == version_id)
+        .order_by(Modules.id, Scenarios.id, TestCases.id)
+    )
+    if include_bugs:
+        statement = statement.outerjoin(Bugs, Bugs.testcases_id == TestCases.id).order_by(Bugs.id)
+    return db.session.execute(statement.execution_options(yield_per=EXPORT_FETCH_SIZE))
+
+
+def iter_version_export_ndjson(version_id, include_bugs):
+    # One JSON object per test case. With bugs, each test case carries a
+    # bugs list built from its adjacent joined rows.
+    dumps = current_app.json.dumps
+    bug_names = [name for name, _ in EXPORT_BUG_COLUMNS]
+    lines = []
+    record = None
+    for row in version_export_rows(version_id, include_bugs):
+        row = row._asdict()
+        if record is None or record['testcase_id'] != row['testcase_id']:
+            if record is not None:
+                lines.append(dumps(record))
+                if len(lines) >= EXPORT_CHUNK_ROWS:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            bug = {name: row.pop(name) for name in bug_names} if include_bugs else None
+            record = row
+            if include_bugs:
+                record['bugs'] = []
+        else:
+            bug = {name: row[name] for name in bug_names}
+        if bug is not None and bug['bug_id'] is not None:
+            record['bugs'].append(bug)
+    if record is not None:
+        lines.append(dumps(record))
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_version_export_csv(version_id, include_bugs):
+    # Flat CSV; with bugs there is one line per (test case, bug) pair
+    columns = EXPORT_COLUMNS + (EXPORT_BUG_COLUMNS if include_bugs else ())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for row in version_export_rows(version_id, include_bugs):
+        writer.writerow(row)
+        pending += 1
+        if pending >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+# Page size for listings when ?limit= is not given, and the largest one allowed
+PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 100))
+PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 1000))
+
+
+def page_request(default_limit=None, max_limit=None):
+    # Reads ?limit= and ?cursor=, where the cursor is the last id of the
+    # previous page. A missing limit means default_limit and larger ones are
+    # clamped to max_limit. Returns (limit, cursor, error); error is a
+    # message for a 400. The limits default to PAGE_SIZE_DEFAULT and
+    # PAGE_SIZE_MAX.
+    default_limit = default_limit or PAGE_SIZE_DEFAULT
+    max_limit = max_limit or PAGE_SIZE_MAX
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None:
+        limit = default_limit
+    elif not re.fullmatch(r'[0-9]+', limit) or int(limit) < 1:
+        return None, None, 'limit must be a positive integer'
+    if cursor is not None and not re.fullmatch(r'[0-9]+', cursor):
+        return None, None, 'cursor must be an id from X-Next-Cursor'
+    return min(int(limit), max_limit), int(cursor) if cursor is not None else None, None
+
+
+def paginate_by_id(query, id_column, row_id, limit, cursor=None):
+    # Keyset pagination: up to limit rows after cursor, in id order.
+    # Returns (rows, next_cursor); next_cursor is None on the last page.
+    if cursor is not None:
+        query = query.filter(id_column > cursor)
+    query = query.order_by(id_column)
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, row_id(rows[-1])
+    return rows, None
+
+
+def conditional_json(payload, next_cursor=None):
+    # JSON response with an ETag; answers 304 when If-None-Match still matches
+    response = jsonify(payload)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# Full-text search over test cases and bugs. Postgres keeps a generated
+# tsvector column (name weighted highest) with a GIN index, plus a trigram
+# index on the name for fuzzy matches; SQLite keeps FTS5 external-content
+# tables that triggers update on every insert, update and delete. The same
+# statements run after create_all, and migration 0012 applies the Postgres
+# ones to existing databases.
+SEARCH_FIELDS = ('testcasename', 'testcasedetails', 'steps', 'expectedresults')
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', 100))
+
+
+def postgres_search_ddl(table):
+    return [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        f"setweight(to_tsvector('english', coalesce(testcasename, '')), 'A') || "
+        f"setweight(to_tsvector('english', coalesce(testcasedetails, '')), 'B') || "
+        f"setweight(to_tsvector('english', coalesce(steps, '') || ' ' || coalesce(expectedresults, '')), 'C')"
+        f") STORED",
+        f'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)',
+        f'CREATE INDEX IF NOT EXISTS ix_{table}_testcasename_trgm ON {table} USING gin (testcasename gin_trgm_ops)'
+    ]
+
+
+def sqlite_search_ddl(table):
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({columns}, content='{table}', content_rowid='id')",
+        f'CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {table}_fts (rowid, {columns}) VALUES (new.id, {new_values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {columns} ON {table} BEGIN '
+        f"INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {table}_fts (rowid, {columns}) VALUES (new.id, {new_values}); END'
+    ]
+
+
+SEARCH_DDL = {
+    'postgresql': postgres_search_ddl,
+    'sqlite': sqlite_search_ddl
+}
+
+
+@event.listens_for(TestCases.__table__, 'after_create')
+@event.listens_for(Bugs.__table__, 'after_create')
+def create_search_index(target, connection, **kwargs):
+    search_ddl = SEARCH_DDL.get(connection.dialect.name)
+    if search_ddl is not None:
+        for statement in search_ddl(target.name):
+            connection.exec_driver_sql(statement)
+
+
+def search_scope(product_id, version_id):
+    if version_id is not None:
+        return 'modules.productversion_id = :version_id'
+    return 'versions.product_id = :product_id'
+
+
+def postgres_search_sql(kinds, scope):
+    # Full-text rank plus name similarity; trigram matches catch typos and
+    # partial words the tsquery misses
+    parts = []
+    if 'testcases' in kinds:
+        parts.append(
+            "SELECT 'testcase' AS type, testcases.id, testcases.testcasename, testcases.testcasedetails, "
+            'testcases.scenario_id, modules.id AS module_id, modules.productversion_id AS version_id, '
+            'ts_rank_cd(testcases.search_vector, query) + similarity(testcases.testcasename, :q) AS score '
+            'FROM testcases '
+            'JOIN scenarios ON scenarios.id = testcases.scenario_id '
+            'JOIN modules ON modules.id = scenarios.module_id '
+            'JOIN versions ON versions.id = modules.productversion_id '
+            "CROSS JOIN websearch_to_tsquery('english', :q) AS query "
+            f'WHERE (testcases.search_vector @@ query OR testcases.testcasename % :q) AND {scope}'
+        )
+    if 'bugs' in kinds:
+        parts.append(
+            "SELECT 'bug' AS type, bugs.id, bugs.testcasename, bugs.testcasedetails, "
+            'NULL AS scenario_id, modules.id AS module_id, modules.productversion_id AS version_id, '
+            'ts_rank_cd(bugs.search_vector, query) + similarity(bugs.testcasename, :q) AS score '
+            'FROM bugs '
+            'JOIN modules ON modules.id = bugs.module_id '
+            'JOIN versions ON versions.id = modules.productversion_id '
+            "CROSS JOIN websearch_to_tsquery('english', :q) AS query "
+            f'WHERE (bugs.search_vector @@ query OR bugs.testcasename % :q) AND {scope}'
+        )
+    return ' UNION ALL '.join(parts)
+
+
+def sqlite_search_sql(kinds, scope):
+    # bm25 is lower for better matches, so it is negated into a score;
+    # weights follow SEARCH_FIELDS
+    parts = []
+    if 'testcases' in kinds:
+        parts.append(
+            "SELECT 'testcase' AS type, testcases.id, testcases.testcasename, testcases.testcasedetails, "
+            'testcases.scenario_id, modules.id AS module_id, modules.productversion_id AS version_id, '
+            '-bm25(testcases_fts, 10.0, 4.0, 1.0, 1.0) AS score '
+            'FROM testcases_fts '
+            'JOIN testcases ON testcases.id = testcases_fts.rowid '
+            'JOIN scenarios ON scenarios.id = testcases.scenario_id '
+            'JOIN modules ON modules.id = scenarios.module_id '
+            'JOIN versions ON versions.id = modules.productversion_id '
+            f'WHERE testcases_fts MATCH :match AND {scope}'
+        )
+    if 'bugs' in kinds:
+        parts.append(
+            "SELECT 'bug' AS type, bugs.id, bugs.testcasename, bugs.testcasedetails, "
+            'NULL AS scenario_id, modules.id AS module_id, modules.productversion_id AS version_id, '
+            '-bm25(bugs_fts, 10.0, 4.0, 1.0, 1.0) AS score '
+            'FROM bugs_fts '
+            'JOIN bugs ON bugs.id = bugs_fts.rowid '
+            'JOIN modules ON modules.id = bugs.module_id '
+            'JOIN versions ON versions.id = modules.productversion_id '
+            f'WHERE bugs_fts MATCH :match AND {scope}'
+        )
+    return ' UNION ALL '.join(parts)
+
+
+def search_test_cases(q, kinds, product_id=None, version_id=None, limit=20, offset=0):
+    # Ranked matches for q within one product or version, best first.
+    # Returns (rows, next_offset); next_offset is None on the last page.
+    connection = db.session.connection()
+    scope = search_scope(product_id, version_id)
+    params = {'q': q, 'product_id': product_id, 'version_id': version_id, 'limit': limit + 1, 'offset': offset}
+    if connection.dialect.name == 'postgresql':
+        sql = postgres_search_sql(kinds, scope)
+    elif connection.dialect.name == 'sqlite':
+        # Every word must match, as a prefix of an indexed word; quoting keeps
+        # FTS5 operators in user input from being parsed as syntax
+        words = re.findall(r'\w+', q)
+        if not words:
+            return [], None
+        params['match'] = ' '.join(f'"{word}"*' for word in words)
+        sql = sqlite_search_sql(kinds, scope)
+    else:
+        raise ValueError(f'Search is not supported on {connection.dialect.name}')
+
+    rows = connection.execute(
+        text(f'SELECT * FROM ({sql}) AS matches ORDER BY score DESC, type, id LIMIT :limit OFFSET :offset'),
+        params
+    ).mappings().all()
+    if len(rows) > limit:
+        return [dict(row) for row in rows[:limit]], offset + limit
+    return [dict(row) for row in rows], None
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def split_sql_statements(sql):
+    # Migration files hold plain statements, each ending with ';' on its line
+    statement = []
+    for line in sql.splitlines():
+        if line.strip().startswith('--') or not line.strip():
+            continue
+        statement.append(line)
+        if line.rstrip().endswith(';'):
+            yield '\n'.join(statement)
+            statement = []
+    if statement:
+        yield '\n'.join(statement)
+
+
+@bp.cli.command('db-upgrade')
+def db_upgrade():
+    """Apply the pending SQL files in migrations/ in version order."""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version VARCHAR(255) PRIMARY KEY, '
+            'applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+        )
+        applied = {row[0] for row in connection.exec_driver_sql('SELECT version FROM schema_migrations')}
+
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        version, extension = os.path.splitext(filename)
+        # Only numbered files are migrations; explain_hot_paths.sql is not
+        if extension != '.sql' or not version.split('_')[0].isdigit() or version in applied:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename)) as migration:
+            statements = list(split_sql_statements(migration.read()))
+        # Each migration is applied in its own transaction
+        with db.engine.begin() as connection:
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            connection.execute(text('INSERT INTO schema_migrations (version) VALUES (:version)'), {'version': version})
+        print('Applied migration', version)
+
+
+@bp.cli.command('rollups-rebuild')
+def rollups_rebuild():
+    """Recompute every test case rollup from scratch."""
+    with db.engine.begin() as connection:
+        lock_rollups(connection)
+        connection.execute(TestCaseRollups.__table__.delete())
+        scenario_ids = [row.id for row in connection.execute(select(Scenarios.id))]
+        module_ids = {row.id for row in connection.execute(select(Modules.id))}
+        refresh_rollups(connection, scenario_ids=scenario_ids, module_ids=module_ids)
+    print('Rebuilt rollups for', len(scenario_ids), 'scenarios and', len(module_ids), 'modules')
+
+
+@bp.cli.command('bubble-push')
+def bubble_push():
+    """Upload every test case still queued for Bubble."""
+    pending = push_bubble_outbox()
+    print('Bubble upload done,', pending, 'test cases still queued')
+
+
+@bp.cli.command('search-rebuild')
+def search_rebuild():
+    """Create the search indexes if missing and repopulate them."""
+    with db.engine.begin() as connection:
+        for table in (TestCases.__table__, Bugs.__table__):
+            create_search_index(table, connection)
+            # Postgres generates its column; FTS5 content tables need a rebuild
+            if connection.dialect.name == 'sqlite':
+                connection.exec_driver_sql(f"INSERT INTO {table.name}_fts ({table.name}_fts) VALUES ('rebuild')")
+    print('Search indexes rebuilt')
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    body = '\n'.join(metric.render() for metric in metrics) + '\n'
+    body += (
+        '# HELP ospi_log_records_dropped_total Log records dropped because the log queue was full\n'
+        '# TYPE ospi_log_records_dropped_total counter\n'
+        f'ospi_log_records_dropped_total {DroppingQueueHandler.dropped}\n'
+    )
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/ospi/html/<int:version_id>', methods=['GET'])
+@read_only
+def html_retrieve(version_id):
+    logging.debug('Retrieve html triggered')
+
+    # HTML belongs to modules, so the version is reached through
+    # modules.productversion_id; ?module_id= narrows it to one module
+    statement = (
+        select(HtmlCodes.id, HtmlCodes.module_id, HtmlCodes.htmlcode, HtmlBlobs.content)
+        .outerjoin(HtmlBlobs, HtmlBlobs.content_hash == HtmlCodes.content_hash)
+        .join(Modules, Modules.id == HtmlCodes.module_id)
+        .where(Modules.productversion_id == version_id)
+        .order_by(HtmlCodes.id)
+    )
+    module_id = request.args.get('module_id', type=int)
+    if module_id is not None:
+        statement = statement.where(HtmlCodes.module_id == module_id)
+
+    return Response(stream_with_context(iter_html_json(statement)), mimetype='application/json'), 200
+
+
+@bp.route('/ospi/users/<int:user_id>/products', methods=['GET'])
+@read_only
+def get_products_for_user(user_id):
+    fields = requested_fields(Products)
+    limit, cursor, error = page_request()
+    if error is not None:
+        return jsonify({'message': error}), 400
+    products, next_cursor = paginate_by_id(
+        project(Products.query.filter_by(user_id=user_id), Products, fields),
+        Products.id,
+        lambda product: product.id,
+        limit,
+        cursor
+    )
+    # print(products)
+    return conditional_json([product.serialize(fields) for product in products], next_cursor)
+
+
+@bp.route('/ospi/users/<int:user_id>/products_withversion', methods=['GET'])
+@read_only
+def get_products_for_user_with_version(user_id):
+    # Latest version per product, looked up only for the products being
+    # returned rather than aggregated over the whole versions table
+    latest_version_id = (
+        select(func.max(Versions.id))
+        .where(Versions.product_id == Products.id)
+        .correlate(Products)
+        .scalar_subquery()
+    )
+
+    # Query to get products, latest version_id, and latest version_name
+    fields = requested_fields(Products)
+    limit, cursor, error = page_request()
+    if error is not None:
+        return jsonify({'message': error}), 400
+    products, next_cursor = paginate_by_id(
+        project(
+            db.session.query(Products, Versions.id, Versions.version_name)
+            .outerjoin(Versions, Versions.id == latest_version_id)
+            .filter(Products.user_id == user_id),
+            Products,
+            fields
+        ),
+        Products.id,
+        lambda product: product[0].id,
+        limit,
+        cursor
+    )
+
+    # Serialize the products, latest_version_id, and latest_version_name
+    product_data = [
+        {
+            'product_info': product[0].serialize(fields),
+            'latest_version_id': product[1],
+            'latest_version_name': product[2]
+        }
+        for product in products
+    ]
+
+    return conditional_json(product_data, next_cursor)
+
+
+# Feedback pages are smaller than product pages: each row carries free text
+FEEDBACK_PAGE_SIZE_DEFAULT = int(os.getenv('FEEDBACK_PAGE_SIZE_DEFAULT', 50))
+FEEDBACK_PAGE_SIZE_MAX = int(os.getenv('FEEDBACK_PAGE_SIZE_MAX', 500))
+
+
+@bp.route('/ospi/feedback', methods=['GET'])
+@read_only
+def list_feedback():
+    # Feedback with a slim user projection, joined in the same query. Filters:
+    # ?rating=, ?min_rating=, ?max_rating= and ISO 8601 ?since= / ?until= on
+    # added_at; pages with ?limit= and ?cursor= like the product listings,
+    # FEEDBACK_PAGE_SIZE_DEFAULT rows at a time unless ?limit= asks otherwise.
+    query = Feedback.query.options(
+        joinedload(Feedback.user).load_only(*[getattr(Users, field) for field in Feedback.user_fields])
+    )
+
+    rating = request.args.get('rating', type=int)
+    min_rating = request.args.get('min_rating', type=int)
+    max_rating = request.args.get('max_rating', type=int)
+    if rating is not None:
+        query = query.filter(Feedback.rating == rating)
+    if min_rating is not None:
+        query = query.filter(Feedback.rating >= min_rating)
+    if max_rating is not None:
+        query = query.filter(Feedback.rating <= max_rating)
+
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        if since:
+            query = query.filter(Feedback.added_at >= datetime.fromisoformat(since))
+        if until:
+            query = query.filter(Feedback.added_at < datetime.fromisoformat(until))
+    except ValueError:
+        return jsonify({'message': 'since and until must be ISO 8601 dates'}), 400
+
+    limit, cursor, error = page_request(FEEDBACK_PAGE_SIZE_DEFAULT, FEEDBACK_PAGE_SIZE_MAX)
+    if error is not None:
+        return jsonify({'message': error}), 400
+    feedback, next_cursor = paginate_by_id(query, Feedback.id, lambda row: row.id, limit, cursor)
+    return conditional_json([row.serialize() for row in feedback], next_cursor)
+
+
+@bp.route('/ospi/testcases/update', methods=['POST'])
+def update_testcases():
+    data = request.get_json(silent=True)
+    updated_test_cases = data.get('testCases') if isinstance(data, dict) else None
+    if not isinstance(updated_test_cases, list) or not all(isinstance(entry, dict) for entry in updated_test_cases):
+        return jsonify({'message': 'testCases must be a list of test case objects'}), 400
+    log_payload('Updated test cases', updated_test_cases)
+    for index, updated_test_case in enumerate(updated_test_cases):
+        error = test_case_update_error(updated_test_case)
+        if error is not None:
+            return jsonify({'message': f'testCases[{index}]: {error}'}), 400
+
+    try:
+        results = bulk_update_test_cases(updated_test_cases)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'An error occurred', 'error': str(e)}), 500
+
+    # Echo the submitted test cases, each tagged 'updated' or 'not found'
+    return jsonify([
+        dict(updated_test_case, result=result)
+        for updated_test_case, result in zip(updated_test_cases, results)
+    ]), 200
+
+
+def expected_row_version(data):
+    # Optional optimistic concurrency token: row_version from the body, else
+    # If-Match, where a weak tag (W/"3") counts like a strong one and * means
+    # any version. Returns (version, error); version None means no check and
+    # error is a (message, status) pair for a token that cannot be used.
+    version = data.get('row_version')
+    if version is not None:
+        if isinstance(version, bool) or not re.fullmatch(r'[0-9]+', str(version).strip()):
+            return None, ('row_version must be a non-negative integer', 400)
+        return int(version), None
+
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None, None
+    tags = if_match.as_set(include_weak=True)
+    if len(tags) != 1:
+        return None, ('If-Match must name a single row_version', 400)
+    tag = tags.pop()
+    if not re.fullmatch(r'[0-9]+', tag):
+        # No row_version can ever equal it
+        return None, ('If-Match does not match the test case', 412)
+    return int(tag), None
+
+
+@bp.route('/ospi/testcases/updateinduvidual', methods=['POST', 'PATCH'])
+def update_testcase_individually():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Expected a JSON object'}), 400
+        error = test_case_update_error(data)
+        if error is not None:
+            return jsonify({'message': error}), 400
+        test_case_id = data.get('id')
+        logging.debug('Updating test case %s', test_case_id)
+
+        expected_version, error = expected_row_version(data)
+        if error is not None:
+            message, status = error
+            return jsonify({'message': message}), status
+
+        row, outcome = update_test_case(test_case_id, test_case_changes(data), expected_version)
+
+        if outcome == 'not found':
+            return jsonify({'message': 'Test case not found'}), 404
+
+        updated_test_case_data = {
+            'id': row.id,
+            'testcasename': row.testcasename,
+            'priority': row.priority,
+            'severity': row.severity,
+            'status': row.status,
+            'row_version': row.row_version
+        }
+        if outcome == 'conflict':
+            return jsonify({
+                'message': 'Test case was modified by someone else',
+                'test_case': updated_test_case_data
+            }), 409
+
+        # Return the updated test case data along with the success message
+        return jsonify(
+            {'message': 'Test case updated successfully', 'test_case': updated_test_case_data}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'An error occurred', 'error': str(e)}), 500
 
 
+@bp.route('/ospi/addHTML', methods=['POST'])
+def add_html():
+    logging.debug('Add html triggered')
+    data = request.json
+
+    # Extract data from the request
+    html_content = data.get('html_content')
+    module_id = data.get('module_id')
+
+    # Create a new Prds object; identical pages share one compressed blob
+    new_html = HtmlCodes(
+        content_hash = store_html_blob(html_content),
+        module_id = module_id
+    )
+
+    # Add the new PRD to the database
+    db.session.add(new_html)
+    db.session.commit()
+    return jsonify({'html_id': new_html.id, 'message': 'HTML added successfully.'}), 200
+
+
+@bp.route('/ospi/addVersion', methods=['POST'])
+def add_version():
+
+    data = request.get_json()
+    log_payload('Add version', data)
+    new_version = Versions(
+        product_id = data.get('productId'),
+        version_name =  data.get('version_name'),
+        changes =  data.get('changes')
+    )
+
+    db.session.add(new_version)
+    db.session.commit()
+    chat_summary_cache.invalidate(new_version.id)
+
+    return jsonify({"message": "OK", "version_id": new_version.id}), 200
+
+
+@bp.route('/ospi/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({name: cache.stats() for name, cache in caches.items()}), 200
+
+
+@bp.route('/ospi/outbound/stats', methods=['GET'])
+def get_outbound_stats():
+    return jsonify({name: client.stats() for name, client in outbound_clients.items()}), 200
+
+
+@bp.route('/ospi/products/versions/<int:version_id>', methods=['GET'])
+@read_only
+def get_chat_summary_for_version(version_id):
+    version = chat_summary_cache.get_or_load(version_id, load_chat_summary)
+    if version is not None:
+        if version['product_id'] is not None:
+            logging.debug('Chat summary found for version %s', version_id)
+            return jsonify({'chatsummary': version['chatsummary']}), 200
+        else:
+            logging.info('Product not found for version %s', version_id)
+            return jsonify({'message': 'Product not found for the version'}), 400
+    else:
+        logging.info('Version %s not found', version_id)
+        return jsonify({'message': 'Version not found'}), 400
+
+
+@bp.route('/ospi/testcasesbulk', methods=['POST'])
+def add_test_cases_bulk():
+    import requests
+
+    try:
+        data = request.json
+        log_payload('Bulk test cases', data)
+
+        # Opt-in async mode: queue the import and hand back a job id
+        if request.args.get('async', '').lower() in ('1', 'true'):
+            job = submit_bulk_job(data)
+            return jsonify({
+                'job_id': job['id'],
+                'status_url': f"/ospi/testcasesbulk/jobs/{job['id']}"
+            }), 202
+
+        progress = {}
+        message = ingest_test_cases(data, progress)
+        lookups = progress.get('score_cache_hits', 0) + progress.get('score_cache_misses', 0)
+        return jsonify({
+            "message": message,
+            "persisted": progress.get('persisted', 0),
+            "bubble_pending": progress.get('bubble_pending', 0),
+            "score_cache": {
+                'hits': progress.get('score_cache_hits', 0),
+                'misses': progress.get('score_cache_misses', 0),
+                'hit_rate': progress.get('score_cache_hits', 0) / lookups if lookups else None
+            }
+        }), 200
+    except UpstreamUnavailable as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 503
+    except requests.RequestException:
+        db.session.rollback()
+        logging.exception('Bulk test case import failed upstream')
+        return jsonify({"error": UPSTREAM_FAILED_MESSAGE}), 502
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@bp.route('/ospi/testcasesbulk/jobs/<job_id>', methods=['GET'])
+def get_bulk_job_status(job_id):
+    job = get_bulk_job(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job), 200
+
+
+@bp.route('/ospi/versions/<int:version_id>/summary', methods=['GET'])
+@read_only
+def get_version_summary(version_id):
+    # Served from the rollup table: one row for the version, one per module
+    rows = (
+        TestCaseRollups.query
+        .filter(
+            ((TestCaseRollups.scope == 'version') & (TestCaseRollups.scope_id == version_id))
+            | ((TestCaseRollups.scope == 'module') & (TestCaseRollups.version_id == version_id))
+        )
+        .all()
+    )
+    version_row = next((row for row in rows if row.scope == 'version'), None)
+    if version_row is None and db.session.get(Versions, version_id) is None:
+        return jsonify({'message': 'Version not found'}), 404
+
+    summary = rollup_summary(version_row)
+    summary['version_id'] = version_id
+    summary['modules'] = [
+        dict(rollup_summary(row), module_id=row.scope_id)
+        for row in sorted(rows, key=lambda row: row.scope_id)
+        if row.scope == 'module'
+    ]
+    return jsonify(summary), 200
+
+
+@bp.route('/ospi/versions/<int:version_id>/testcases/export', methods=['GET'])
+@read_only
+def export_version_test_cases(version_id):
+    # ?format=ndjson (default) or csv; ?include_bugs=1 adds each test case's bugs
+    export_format = request.args.get('format', 'ndjson').lower()
+    include_bugs = request.args.get('include_bugs', '').lower() in ('1', 'true')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'message': 'format must be ndjson or csv'}), 400
+    if db.session.get(Versions, version_id) is None:
+        return jsonify({'message': 'Version not found'}), 404
+
+    if export_format == 'csv':
+        body, mimetype = iter_version_export_csv(version_id, include_bugs), 'text/csv'
+    else:
+        body, mimetype = iter_version_export_ndjson(version_id, include_bugs), 'application/x-ndjson'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=version-{version_id}-testcases.{export_format}'
+    return response
+
+
+@bp.route('/ospi/search', methods=['GET'])
+@read_only
+def search():
+    # ?q= within ?version_id= or ?product_id=; ?type=testcases or bugs narrows
+    # it. ?limit= pages the ranked results and ?cursor= is the offset taken
+    # from the previous page's X-Next-Cursor.
+    q = request.args.get('q', '').strip()
+    version_id = request.args.get('version_id', type=int)
+    product_id = request.args.get('product_id', type=int)
+    kinds = request.args.get('type', 'all')
+    limit = min(request.args.get('limit', 20, type=int), SEARCH_MAX_LIMIT)
+    offset = request.args.get('cursor', 0, type=int)
+    if not q:
+        return jsonify({'message': 'q is required'}), 400
+    if version_id is None and product_id is None:
+        return jsonify({'message': 'version_id or product_id is required'}), 400
+    if kinds not in ('all', 'testcases', 'bugs'):
+        return jsonify({'message': 'type must be all, testcases or bugs'}), 400
+
+    results, next_cursor = search_test_cases(
+        q,
+        ('testcases', 'bugs') if kinds == 'all' else (kinds,),
+        product_id=product_id,
+        version_id=version_id,
+        limit=max(limit, 1),
+        offset=max(offset, 0)
+    )
+    return conditional_json(results, next_cursor)
+
+
+def create_app(config=None):
+    # Builds the app from the environment, with config overriding it. Engines
+    # are created here, not at import; connections open on first use.
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
+    app.config['AIMODEL_BASE_URL'] = os.getenv('AIMODEL_BASE_URL')
+    app.config['TESTCASE_GENERATION_BASE_URL'] = os.getenv('TESTCASE_GENERATION_BASE_URL')
+    app.config['BUBBLE_WF_URL'] = os.getenv('BUBBLE_WF_URL')
+    app.config['BUBBLE_DATA_URL'] = os.getenv('BUBBLE_DATA_URL')
+    app.config['TARGETTED_REG_URL'] = os.getenv('TARGETTED_REG_URL')
+
+    # Optional read replica for the read-only GET routes
+    replica_uri = os.getenv('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        app.config['SQLALCHEMY_BINDS'] = {
+            'replica': dict(engine_options(replica_uri), url=replica_uri)
+        }
+    if config:
+        app.config.update(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    configure_logging()
+    CORS(app)
+    # The orjson encoder is used when it is installed unless JSON_ENCODER=json
+    if os.getenv('JSON_ENCODER', 'orjson') == 'orjson' and importlib.util.find_spec('orjson') is not None:
+        app.json = ORJSONProvider(app)
+
+    db.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+
+default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # Builds the module-level app on first access, so test:app keeps working
+    # for gunicorn and flask while importing the module stays cheap
+    if name != 'app':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    global app
+    with default_app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return app
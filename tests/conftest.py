@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test as ospi  # noqa: E402
+from sqlalchemy import DefaultClause  # noqa: E402
+
+
+class FakeResponse:
+
+    def __init__(self, payload, text='ok'):
+        self.payload = payload
+        self.text = text
+        self.status_code = 200
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # Replaces every outbound call: the scorer echoes each case back with a
+    # failure_probability, anything else (Bubble) answers ok. Calls are
+    # recorded as (client name, url, kwargs).
+    calls = []
+
+    def request(client, method, url, **kwargs):
+        calls.append((client.name, url, kwargs))
+        if client is ospi.scorer_client:
+            cases = kwargs['json'] if isinstance(kwargs['json'], list) else [kwargs['json']]
+            return FakeResponse([dict(case, failure_probability=0.25) for case in cases])
+        return FakeResponse(None)
+
+    monkeypatch.setattr(ospi.OutboundClient, 'request', request)
+    return calls
+
+
+@pytest.fixture
+def app(tmp_path, upstream):
+    # A fresh SQLite database per test with one user, product, version,
+    # module and scenario (all id 1)
+    app = ospi.create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/ospi.db',
+        'TARGETTED_REG_URL': 'http://scorer',
+        'BUBBLE_DATA_URL': 'http://bubble'
+    })
+    for cache in ospi.caches.values():
+        cache.clear()
+
+    with app.app_context():
+        # Assigned by the database in production
+        ospi.TestCases.__table__.c.testcasenumber.server_default = DefaultClause('0')
+        ospi.db.create_all()
+        session = ospi.db.session
+        session.add(ospi.Users(id=1, name='user', email='user@example.com'))
+        session.add(ospi.Products(id=1, product_name='product', user_id=1, chatsummary='summary'))
+        session.add(ospi.Versions(id=1, product_id=1, version_name='v1'))
+        session.add(ospi.Modules(id=1, modulenumber=1, modulename='module', productversion_id=1))
+        session.add(ospi.Scenarios(id=1, scenarionumber=1, scenarioname='scenario', module_id=1))
+        session.commit()
+        yield app
+        ospi.rollup_queue.join()
+        session.remove()
+        ospi.db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
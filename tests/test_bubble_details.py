@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import test as ospi
+
+
+def add_test_cases(count):
+    session = ospi.db.session
+    for i in range(1, count + 1):
+        session.add(ospi.TestCases(
+            id=i, testcasenumber=i, testcasename=f'case {i}', testcasedetails='details',
+            priority='High', severity='Major', status=None, failure_probability=0.5, scenario_id=1
+        ))
+    session.commit()
+    # Let the background rollup refresh finish before anything is measured
+    ospi.rollup_queue.join()
+    return list(range(1, count + 1))
+
+
+def test_detail_lines_follow_the_requested_order(app):
+    add_test_cases(3)
+    lines = ospi.get_test_case_details_bulk([3, 1, 99, 2])
+
+    details = [json.loads(line) for line in lines]
+    assert [row['testcasename'] for row in details] == ['case 3', 'case 1', 'case 2']
+    assert list(details[0]) == list(ospi.BUBBLE_DETAIL_FIELDS)
+    assert details[0]['failure_probability'] == 0.5
+    assert details[0]['product_name'] == 'product'
+
+
+def test_detail_lines_use_one_query_per_batch(app, monkeypatch):
+    from sqlalchemy import event
+
+    ids = add_test_cases(5)
+    monkeypatch.setattr(ospi, 'DEDUP_BATCH_SIZE', 2)
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(ospi.db.engine, 'before_cursor_execute', listener)
+    try:
+        lines = ospi.get_test_case_details_bulk(ids)
+    finally:
+        event.remove(ospi.db.engine, 'before_cursor_execute', listener)
+
+    assert len(lines) == 5
+    assert len(statements) == 3
+
+
+def test_detail_lines_match_the_app_helper(app):
+    # Only runs where the external app module is importable
+    helper = pytest.importorskip('app').get_test_case_details
+    ids = add_test_cases(3)
+    lines = ospi.get_test_case_details_bulk(ids)
+    assert [json.loads(line) for line in lines] == [json.loads(helper(i)) for i in ids]
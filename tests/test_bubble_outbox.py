@@ -0,0 +1,68 @@
+import requests
+
+import test as ospi
+
+
+def bulk_rows(names):
+    return [
+        {'testcasename': name, 'priority': 'High', 'severity': 'Major', 'scenario_id': 1,
+         'module_id': 1, 'status': None, 'testcasedetails': 'details'}
+        for name in names
+    ]
+
+
+def bubble_posts(upstream):
+    return [call for call in upstream if call[0] == 'bubble']
+
+
+def queued_ids():
+    return sorted(row.test_case_id for row in ospi.BubbleOutbox.query.all())
+
+
+def fail_bubble(monkeypatch):
+    request = ospi.OutboundClient.request
+
+    def failing(client, method, url, **kwargs):
+        if client is ospi.bubble_client:
+            raise requests.ConnectionError('bubble is down')
+        return request(client, method, url, **kwargs)
+
+    monkeypatch.setattr(ospi.OutboundClient, 'request', failing)
+
+
+def test_failed_upload_is_queued_and_pushed_on_retry(client, upstream, monkeypatch):
+    with monkeypatch.context() as patch:
+        fail_bubble(patch)
+        response = client.post('/ospi/testcasesbulk', json=bulk_rows(['a', 'b']))
+    assert response.status_code == 200
+    assert response.get_json()['bubble_pending'] == 2
+    assert queued_ids() == [1, 2]
+
+    response = client.post('/ospi/testcasesbulk', json=bulk_rows(['a', 'b']))
+    assert response.get_json()['message'] == 'No new testcases to add'
+    assert queued_ids() == []
+    assert len(bubble_posts(upstream)) == 1
+
+
+def test_claimed_rows_are_not_claimed_again(client, monkeypatch):
+    with monkeypatch.context() as patch:
+        fail_bubble(patch)
+        client.post('/ospi/testcasesbulk', json=bulk_rows(['a', 'b']))
+
+    token, claimed = ospi.claim_bubble_outbox({1})
+    assert claimed == [1, 2]
+    assert ospi.claim_bubble_outbox({1})[1] == []
+    # Nothing left to claim, so a concurrent push sends nothing
+    assert ospi.push_bubble_outbox({1}) == 0
+
+    monkeypatch.setattr(ospi, 'BUBBLE_CLAIM_TTL', -1)
+    assert ospi.claim_bubble_outbox({1})[1] == [1, 2]
+
+
+def test_failed_upload_releases_its_claim(client, monkeypatch):
+    with monkeypatch.context() as patch:
+        fail_bubble(patch)
+        client.post('/ospi/testcasesbulk', json=bulk_rows(['a']))
+        assert ospi.push_bubble_outbox({1}) == 1
+
+    assert ospi.claim_bubble_outbox({1})[1] == [1]
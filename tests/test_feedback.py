@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import event
+
+import test as ospi
+
+
+@pytest.fixture
+def feedback(app):
+    session = ospi.db.session
+    for i in range(1, 8):
+        session.add(ospi.Feedback(id=i, rating=i % 5 + 1, feedback_text=f'feedback {i}', user_id=1))
+    session.commit()
+
+
+def feedback_ids(response):
+    return [row['id'] for row in response.get_json()]
+
+
+def test_feedback_is_paged_by_default(client, feedback, monkeypatch):
+    monkeypatch.setattr(ospi, 'FEEDBACK_PAGE_SIZE_DEFAULT', 3)
+    response = client.get('/ospi/feedback')
+    assert feedback_ids(response) == [1, 2, 3]
+    assert response.headers['X-Next-Cursor'] == '3'
+    assert response.get_json()[0]['user'] == {'id': 1, 'name': 'user', 'email': 'user@example.com'}
+
+    response = client.get('/ospi/feedback?cursor=3&limit=10')
+    assert feedback_ids(response) == [4, 5, 6, 7]
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_feedback_limit_is_capped(client, feedback, monkeypatch):
+    monkeypatch.setattr(ospi, 'FEEDBACK_PAGE_SIZE_MAX', 2)
+    assert feedback_ids(client.get('/ospi/feedback?limit=10000000')) == [1, 2]
+
+
+def test_feedback_page_is_one_query(client, feedback):
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(ospi.db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/ospi/feedback?min_rating=2')
+    finally:
+        event.remove(ospi.db.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize('query', ['limit=-3', 'limit=0', 'limit=x', 'since=yesterday'])
+def test_bad_feedback_arguments_are_rejected(client, feedback, query):
+    assert client.get(f'/ospi/feedback?{query}').status_code == 400
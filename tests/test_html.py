@@ -0,0 +1,30 @@
+from sqlalchemy import event
+
+import test as ospi
+
+
+def test_identical_html_is_stored_once(client):
+    for _ in range(2):
+        response = client.post('/ospi/addHTML', json={'html_content': '<html>same</html>', 'module_id': 1})
+        assert response.status_code < 400
+
+    assert ospi.HtmlCodes.query.count() == 2
+    assert ospi.HtmlBlobs.query.count() == 1
+    assert [row['htmlcode'] for row in client.get('/ospi/html/1').get_json()] == ['<html>same</html>'] * 2
+
+
+def test_existing_blob_is_checked_without_loading_it(app):
+    ospi.store_html_blob('<html>page</html>')
+    ospi.db.session.commit()
+    ospi.db.session.expunge_all()
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(ospi.db.engine, 'before_cursor_execute', listener)
+    try:
+        ospi.store_html_blob('<html>page</html>')
+    finally:
+        event.remove(ospi.db.engine, 'before_cursor_execute', listener)
+
+    assert len(statements) == 1
+    assert 'htmlblobs.content ' not in statements[0] and 'htmlblobs.content,' not in statements[0]
@@ -0,0 +1,52 @@
+import time
+
+import requests
+
+import test as ospi
+from test_bubble_outbox import bulk_rows
+
+
+def fail_scorer(monkeypatch):
+    request = ospi.OutboundClient.request
+
+    def failing(client, method, url, **kwargs):
+        if client is ospi.scorer_client:
+            raise requests.ConnectionError(
+                "HTTPConnectionPool(host='scorer', port=80): Max retries exceeded "
+                "(Caused by NewConnectionError('<urllib3.connection.HTTPConnection object>'))"
+            )
+        return request(client, method, url, **kwargs)
+
+    monkeypatch.setattr(ospi.OutboundClient, 'request', failing)
+
+
+def test_scorer_failure_answers_502_without_the_raw_error(client, monkeypatch):
+    fail_scorer(monkeypatch)
+    response = client.post('/ospi/testcasesbulk', json=bulk_rows(['a']))
+    assert response.status_code == 502
+    assert response.get_json() == {'error': ospi.UPSTREAM_FAILED_MESSAGE}
+    assert ospi.TestCases.query.count() == 0
+
+
+def test_unavailable_scorer_still_answers_503(client, monkeypatch):
+    def unavailable(client, method, url, **kwargs):
+        raise ospi.UpstreamUnavailable('scorer circuit is open')
+
+    monkeypatch.setattr(ospi.OutboundClient, 'request', unavailable)
+    response = client.post('/ospi/testcasesbulk', json=bulk_rows(['a']))
+    assert response.status_code == 503
+
+
+def test_failed_async_job_hides_the_raw_error(client, monkeypatch):
+    fail_scorer(monkeypatch)
+    response = client.post('/ospi/testcasesbulk?async=1', json=bulk_rows(['a']))
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    for _ in range(100):
+        job = client.get(status_url).get_json()
+        if job['status'] == 'failed':
+            break
+        time.sleep(0.05)
+    assert job['status'] == 'failed'
+    assert job['error'] == ospi.UPSTREAM_FAILED_MESSAGE
@@ -0,0 +1,48 @@
+import pytest
+
+import test as ospi
+
+
+@pytest.fixture
+def products(app):
+    # Products 2-8 for user 1, after the seeded product 1
+    session = ospi.db.session
+    for i in range(2, 9):
+        session.add(ospi.Products(id=i, product_name=f'product {i}', user_id=1))
+    session.commit()
+
+
+def product_ids(response):
+    return [product['id'] for product in response.get_json()]
+
+
+def test_pages_follow_the_cursor(client, products):
+    response = client.get('/ospi/users/1/products?limit=3')
+    assert product_ids(response) == [1, 2, 3]
+    cursor = response.headers['X-Next-Cursor']
+
+    response = client.get(f'/ospi/users/1/products?limit=3&cursor={cursor}')
+    assert product_ids(response) == [4, 5, 6]
+
+    response = client.get('/ospi/users/1/products?limit=3&cursor=6')
+    assert product_ids(response) == [7, 8]
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_default_page_size_applies_without_limit(client, products, monkeypatch):
+    monkeypatch.setattr(ospi, 'PAGE_SIZE_DEFAULT', 5)
+    response = client.get('/ospi/users/1/products')
+    assert product_ids(response) == [1, 2, 3, 4, 5]
+    assert response.headers['X-Next-Cursor'] == '5'
+
+
+def test_limit_is_clamped_to_the_maximum(client, products, monkeypatch):
+    monkeypatch.setattr(ospi, 'PAGE_SIZE_MAX', 4)
+    response = client.get('/ospi/users/1/products_withversion?limit=10000000')
+    assert len(response.get_json()) == 4
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-3', 'limit=abc', 'cursor=x'])
+@pytest.mark.parametrize('path', ['/ospi/users/1/products', '/ospi/users/1/products_withversion'])
+def test_bad_page_arguments_are_rejected(client, products, path, query):
+    assert client.get(f'{path}?{query}').status_code == 400
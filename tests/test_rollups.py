@@ -0,0 +1,77 @@
+import pytest
+
+import test as ospi
+
+
+def bulk_rows(count, scenario_id, start=0):
+    return [
+        {'testcasename': f'case {i}', 'priority': 'High' if i % 2 else 'Low', 'severity': 'Major',
+         'scenario_id': scenario_id, 'module_id': 1, 'status': None, 'testcasedetails': 'details'}
+        for i in range(start, start + count)
+    ]
+
+
+def stored_rollups():
+    ospi.rollup_queue.join()
+    ospi.db.session.expire_all()
+    return {
+        (row.scope, row.scope_id): ospi.rollup_summary(row)
+        for row in ospi.TestCaseRollups.query.all()
+    }
+
+
+@pytest.fixture
+def second_scenario(app):
+    ospi.db.session.add(ospi.Scenarios(id=2, scenarionumber=2, scenarioname='scenario 2', module_id=1))
+    ospi.db.session.commit()
+
+
+def test_queued_refreshes_match_a_rebuild(app, client, second_scenario):
+    assert client.post('/ospi/testcasesbulk', json=bulk_rows(4, 1)).status_code == 200
+    assert client.post('/ospi/testcasesbulk', json=bulk_rows(3, 2, start=4)).status_code == 200
+
+    response = client.post('/ospi/testcases/update', json={'testCases': [
+        {'id': 1, 'status': 'Pass'},
+        {'id': 2, 'status': 'Fail', 'severity': 'Minor'},
+        {'id': 5, 'priority': 'Critical'}
+    ]})
+    assert response.status_code == 200
+    assert client.patch('/ospi/testcases/updateinduvidual', json={'id': 6, 'status': 'Pass'}).status_code == 200
+    assert client.patch('/ospi/testcases/updateinduvidual', json={'id': 3, 'priority': 'High'}).status_code == 200
+
+    ospi.db.session.add(ospi.Bugs(testcasenumber=1, testcasename='bug', priority='High', severity='Major',
+                                  module_id=1, testcases_id=2))
+    ospi.db.session.add(ospi.Bugs(testcasenumber=2, testcasename='module bug', priority='Low', severity='Minor',
+                                  module_id=1))
+    ospi.db.session.commit()
+
+    incremental = stored_rollups()
+    version = incremental[('version', 1)]
+    assert (version['total'], version['passed'], version['failed'], version['untested']) == (7, 2, 1, 4)
+    assert version['bugs'] == 2
+    assert version['by_priority'] == {'Critical': 1, 'High': 4, 'Low': 2}
+    assert incremental[('scenario', 2)]['total'] == 3
+
+    result = app.test_cli_runner().invoke(args=['rollups-rebuild'])
+    assert result.exit_code == 0, result.output
+    assert stored_rollups() == incremental
+
+
+def test_summary_is_served_from_the_rollups(client):
+    assert client.post('/ospi/testcasesbulk', json=bulk_rows(2, 1)).status_code == 200
+    ospi.rollup_queue.join()
+
+    summary = client.get('/ospi/versions/1/summary').get_json()
+    assert summary['total'] == 2
+    assert summary['modules'][0]['module_id'] == 1
+    assert client.get('/ospi/versions/99/summary').status_code == 404
+
+
+def test_a_failed_refresh_does_not_fail_the_write(client, monkeypatch):
+    def broken(connection, **dirty):
+        raise RuntimeError('rollups unavailable')
+
+    monkeypatch.setattr(ospi, 'refresh_rollups', broken)
+    assert client.post('/ospi/testcasesbulk', json=bulk_rows(2, 1)).status_code == 200
+    assert stored_rollups() == {}
+    assert ospi.TestCases.query.count() == 2
@@ -0,0 +1,30 @@
+# Cold start budget: importing test.py and calling create_app() in a fresh
+# interpreter, with no SQLALCHEMY_DATABASE_URI in the environment, must stay
+# within STARTUP_BUDGET_MS and must not import requests.
+#
+#   python -m pytest tests/test_startup.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import measure_startup  # noqa: E402
+
+STARTUP_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', 1500))
+STARTUP_RUNS = int(os.getenv('STARTUP_RUNS', 3))
+
+
+@pytest.fixture(scope='module')
+def startup():
+    return measure_startup(STARTUP_RUNS)
+
+
+def test_cold_start_is_within_budget(startup):
+    assert startup['total_ms'] <= STARTUP_BUDGET_MS, startup
+
+
+def test_cold_start_does_not_import_requests(startup):
+    assert 'requests' not in startup['eager_modules'], startup
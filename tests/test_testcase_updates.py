@@ -0,0 +1,112 @@
+import pytest
+
+import test as ospi
+
+
+@pytest.fixture
+def test_cases(app):
+    session = ospi.db.session
+    for i in (1, 2):
+        session.add(ospi.TestCases(
+            id=i, testcasenumber=i, testcasename=f'case {i}', testcasedetails='details',
+            priority='High', severity='Major', scenario_id=1
+        ))
+    session.commit()
+
+
+def stored(test_case_id):
+    ospi.db.session.expire_all()
+    return ospi.db.session.get(ospi.TestCases, test_case_id)
+
+
+def test_bulk_update_changes_only_sent_fields(client, test_cases):
+    response = client.post('/ospi/testcases/update', json={'testCases': [
+        {'id': 1, 'priority': 'Low', 'status': 'Pass'},
+        {'id': 2, 'testCase': 'renamed'},
+        {'id': 99, 'priority': 'Low'}
+    ]})
+    assert response.status_code == 200
+    assert [row['result'] for row in response.get_json()] == ['updated', 'updated', 'not found']
+    assert (stored(1).priority, stored(1).status, stored(1).testcasename) == ('Low', True, 'case 1')
+    assert (stored(2).priority, stored(2).testcasename, stored(2).row_version) == ('High', 'renamed', 2)
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'testCases': [1]},
+    {'testCases': [{'id': 2, 'priority': None}]},
+    {'testCases': [{'id': 2, 'testcasename': None}]},
+    {'testCases': [{'id': [1], 'priority': 'Low'}]},
+    {'testCases': [{'id': '1', 'priority': 'Low'}]},
+    {'testCases': [{'id': 1, 'severity': 5}]},
+    {'testCases': [{'id': 1, 'priority': 'x' * 51}]}
+])
+def test_bulk_update_rejects_bad_values_before_sql(client, test_cases, body):
+    response = client.post('/ospi/testcases/update', json=body)
+    assert response.status_code == 400
+    assert 'SELECT' not in response.get_data(as_text=True)
+    assert stored(1).row_version == 1
+
+
+@pytest.mark.parametrize('body', [
+    {'id': 1, 'priority': None},
+    {'id': [1], 'priority': 'Low'},
+    {'id': None, 'priority': 'Low'}
+])
+def test_individual_update_rejects_bad_values(client, test_cases, body):
+    response = client.patch('/ospi/testcases/updateinduvidual', json=body)
+    assert response.status_code == 400
+    assert stored(1).row_version == 1
+
+
+def test_individual_update_allows_clearing_nullable_fields(client, test_cases):
+    response = client.patch('/ospi/testcases/updateinduvidual', json={'id': 1, 'testcasedetails': None})
+    assert response.status_code == 200
+    assert stored(1).testcasedetails is None
+
+
+def patch(client, body, if_match=None):
+    headers = {'If-Match': if_match} if if_match is not None else {}
+    return client.patch('/ospi/testcases/updateinduvidual', json=body, headers=headers)
+
+
+def test_individual_update_leaves_unsent_fields_alone(client, test_cases):
+    response = patch(client, {'id': 1, 'priority': 'Low'})
+    assert response.status_code == 200
+    assert response.get_json()['test_case']['row_version'] == 2
+    row = stored(1)
+    assert (row.priority, row.severity, row.testcasename, row.testcasedetails) == ('Low', 'Major', 'case 1', 'details')
+
+
+def test_stale_row_version_conflicts(client, test_cases):
+    assert patch(client, {'id': 1, 'priority': 'Low', 'row_version': 1}).status_code == 200
+    response = patch(client, {'id': 1, 'priority': 'Medium', 'row_version': 1})
+    assert response.status_code == 409
+    assert response.get_json()['test_case']['priority'] == 'Low'
+    assert stored(1).row_version == 2
+
+
+@pytest.mark.parametrize('if_match', ['"1"', 'W/"1"', '*'])
+def test_matching_if_match_updates(client, test_cases, if_match):
+    assert patch(client, {'id': 1, 'priority': 'Low'}, if_match).status_code == 200
+    assert stored(1).priority == 'Low'
+
+
+@pytest.mark.parametrize('if_match, status', [
+    ('W/"5"', 409),
+    ('"abc"', 412),
+    ('"1", "2"', 400)
+])
+def test_unusable_if_match_is_rejected(client, test_cases, if_match, status):
+    assert patch(client, {'id': 1, 'priority': 'Low'}, if_match).status_code == status
+    assert stored(1).priority == 'High'
+
+
+@pytest.mark.parametrize('row_version', ['x', 1.5, True, -1])
+def test_malformed_row_version_is_rejected(client, test_cases, row_version):
+    assert patch(client, {'id': 1, 'priority': 'Low', 'row_version': row_version}).status_code == 400
+    assert stored(1).row_version == 1
+
+
+def test_missing_test_case_is_not_found(client, test_cases):
+    assert patch(client, {'id': 77, 'priority': 'Low'}).status_code == 404